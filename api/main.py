@@ -6,7 +6,18 @@ import numpy as np
 import base64
 import uvicorn
 import time
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import struct
+import shutil
+import threading
+import asyncio
+from typing import List
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+try:
+    import msgpack # tuỳ chọn, cho client gửi Accept: application/msgpack
+except ImportError:
+    msgpack = None
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
@@ -15,6 +26,16 @@ sys.path.append(project_root)
 from src.pipeline import ALPRPipeline
 from src.services.logger_service import LoggerService
 from src.services.monitor_service import MonitorService
+from src.services.config_service import load_settings
+from src.services.session_registry import SessionRegistry, FrameSuperseded
+from src.services.inference_executor import InferenceExecutor
+from src.services.crop_store import CropStore, best_crop, crop_etag
+from src.services.video_jobs import VideoJobManager
+from src.services.worker_pool import WorkerPool
+from src.services.admission import AdmissionController, Overloaded
+from src.services.metrics import MetricsRegistry
+from src.schemas import (OCRResult, CropRef, TrackedObject, FrameResult, FrameBatchResult, PlateRead, JobStatus,
+                         JobResults)
 
 app = FastAPI()
 
@@ -22,103 +43,606 @@ app = FastAPI()
 pipeline_model = None
 logger_service = None
 monitor_service = None
+# Tracker state per camera id, the models in pipeline_model are shared
+session_registry = None
+# Micro-batches concurrent requests into one model call, off the event loop
+inference_executor = None
+# Encoded best crops, served by GET /crops/{camera_id}/{track_id}
+crop_store = None
+# Uploaded videos processed on the server (POST /jobs)
+video_jobs = None
+max_batch_files = 32
+# Global bound on accepted, unanswered frames (429 past it) + drop/shed counters
+admission = AdmissionController()
+# Stage histograms, counters and queue gauges of the pipeline and the API, GET /metrics
+metrics_registry = MetricsRegistry()
+decode_timer = metrics_registry.histogram('alpr_stage_seconds', 'Time per pipeline / API stage', stage='decode')
+encode_timer = metrics_registry.histogram('alpr_stage_seconds', 'Time per pipeline / API stage', stage='encode')
+serialize_timer = metrics_registry.histogram('alpr_stage_seconds', 'Time per pipeline / API stage', stage='serialize')
+
+def register_gauges():
+    # Read at scrape time, through the globals (services are created at startup)
+    m = metrics_registry
+    m.gauge('alpr_executor_queue_depth', 'Requests waiting for an inference batch',
+            fn=lambda: inference_executor.queued() if inference_executor else 0)
+    m.gauge('alpr_inflight_frames', 'Frames accepted and not answered yet', fn=lambda: admission.inflight)
+    m.gauge('alpr_sessions', 'Camera sessions held by the API',
+            fn=lambda: len(session_registry.sessions) if session_registry else 0)
+    m.gauge('alpr_video_jobs', 'Video jobs by status', status='running',
+            fn=lambda: video_jobs.stats()['running'] if video_jobs else 0)
+    m.gauge('alpr_video_jobs', 'Video jobs by status', status='queued',
+            fn=lambda: video_jobs.stats()['queued'] if video_jobs else 0)
+    m.gauge('alpr_ready', '1 once the models are loaded and warmed up',
+            fn=lambda: int(model_status["state"] == "ready"))
+    m.counter('alpr_frames_shed_total', 'Frames refused by admission control', fn=lambda: admission.shed)
+    m.counter('alpr_frames_dropped_total', 'Frames replaced by a newer frame of the same camera',
+              fn=lambda: admission.dropped)
+
+# Model loading state for the probes: starting -> loading -> warming -> ready | failed
+model_status = {"state": "starting", "error": None, "timings": {}}
+started_at = time.time()
+
+def load_models(loop):
+    # Runs on its own thread: the server answers /healthz and /ready (503) meanwhile,
+    # endpoints needing the models answer 503 until pipeline_model is set, last
+    global pipeline_model, session_registry, inference_executor, crop_store, video_jobs, max_batch_files, admission
 
-@app.on_event("startup")
-def startup_event():
-    global pipeline_model, logger_service, monitor_service
-    
     model_path = os.path.join(project_root, 'models', 'yolo', 'weights', 'best.pt')
     if not os.path.exists(model_path):
         print(f"Không tìm thấy model tại {model_path}")
-    
+
+    start = time.perf_counter()
     try:
-        pipeline_model = ALPRPipeline(yolo_path=model_path, use_gpu=True)
-        print("Pipeline AI: Ready.")
+        settings = load_settings()
+        model_status["state"] = "loading"
+        crop_store = CropStore(**settings['api']['crops'])
+        max_batch_files = settings['api']['jobs']['max_batch_files']
+        admission = AdmissionController(**settings['api']['admission'])
+
+        workers_cfg = settings['api']['workers']
+        if workers_cfg['count'] > 0:
+            # Models and trackers live in the worker processes, they send their stage metrics back
+            pool = WorkerPool(model_path, settings, metrics=metrics_registry, **workers_cfg).launch()
+            session_registry = SessionRegistry(pool, on_evict=pool.release, **settings['api']['sessions'])
+            inference_executor = pool
+            loop.call_soon_threadsafe(pool.start)
+            pipeline_model = pool
+
+            model_status["timings"] = dict(pool.load_times, total=round(time.perf_counter() - start, 3))
+            model_status["state"] = "ready"
+            print(f"Pipeline AI: Ready ({pool.count} workers). {model_status['timings']}")
+            return
+
+        pipeline = ALPRPipeline.from_settings(model_path, settings, use_gpu=True, metrics=metrics_registry)
+
+        warmup_cfg = settings['api']['warmup']
+        if warmup_cfg['enabled']:
+            model_status["state"] = "warming"
+            width, height = warmup_cfg['frame_size']
+            batch_sizes = {1, settings['pipeline']['batch_size'], settings['api']['executor']['max_batch']}
+            pipeline.warmup(frame_shape=(height, width, 3), batch_sizes=batch_sizes)
+
+        session_registry = SessionRegistry(pipeline, **settings['api']['sessions'])
+        inference_executor = InferenceExecutor(pipeline, metrics=metrics_registry, **settings['api']['executor'])
+        jobs_cfg = settings['api']['jobs']
+        video_jobs = VideoJobManager(pipeline, os.path.join(project_root, 'data', 'jobs'),
+                                     max_jobs=jobs_cfg['max_jobs'], max_concurrent=jobs_cfg['max_concurrent'],
+                                     max_results=jobs_cfg['max_results'])
+        # The batcher task lives on the server's event loop, not on this thread
+        loop.call_soon_threadsafe(inference_executor.start)
+        pipeline_model = pipeline
+
+        model_status["timings"] = dict(pipeline.load_times, total=round(time.perf_counter() - start, 3))
+        model_status["state"] = "ready"
+        print(f"Pipeline AI: Ready. {model_status['timings']}")
     except Exception as e:
+        model_status["state"] = "failed"
+        model_status["error"] = str(e)
         print(f"Lỗi khởi tạo Model: {e}")
 
+def motion_totals():
+    # The session registry only exists once the models are loaded
+    return session_registry.motion_totals() if session_registry else (0, 0)
+
+@app.on_event("startup")
+async def startup_event():
+    global logger_service, monitor_service
+
     try:
         logger_service = LoggerService(project_root=project_root)
-        monitor_service = MonitorService(log_interval_frames=50, log_interval_seconds=30, project_root=project_root)
+        monitor_service = MonitorService(log_interval_frames=50, log_interval_seconds=30, project_root=project_root,
+                                         motion_stats=motion_totals, metrics=metrics_registry)
+        register_gauges()
         print("Services (Logger/Monitor): Ready.")
     except Exception as e:
         print(f"Lỗi khởi tạo Services: {e}")
 
+    if inference_executor:
+        inference_executor.start()
+    if pipeline_model is None:
+        threading.Thread(target=load_models, args=(asyncio.get_running_loop(),), name="model-loader",
+                         daemon=True).start()
+
 @app.on_event("shutdown")
 def shutdown_event():
     global logger_service
     if logger_service:
         logger_service.stop()
+    if inference_executor:
+        inference_executor.stop()
+    if video_jobs:
+        video_jobs.stop()
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc):
+    return JSONResponse(status_code=429, content={"detail": "Server quá tải, thử lại sau."},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(FrameSuperseded)
+async def superseded_handler(request, exc):
+    # Not an error for a live client: a newer frame of its camera is being processed instead
+    admission.dropped += 1
+    return JSONResponse(status_code=409, content={"detail": "Frame đã được thay bằng frame mới hơn."})
 
-def numpy_to_base64(img_array):
-    if img_array is None: return None
-    _, buffer = cv2.imencode('.jpg', img_array)
-    return base64.b64encode(buffer).decode('utf-8')
+def crop_url(camera_id, track_id):
+    return f"/crops/{camera_id}/{track_id}"
 
-def clean_numpy_data(data):
-    if isinstance(data, dict):
-        return {k: clean_numpy_data(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [clean_numpy_data(v) for v in data]
-    elif isinstance(data, (np.int64, np.int32, np.int_)): return int(data)
-    elif isinstance(data, (np.float32, np.float64, np.float_)): return float(data)
-    elif isinstance(data, np.ndarray): return data.tolist()
-    else: return data
+def to_tracked_object(session, trk, embed_crops=True):
+    # Box, best read and crop version as of this frame (frame_best, set by the pipeline): in a
+    # batch the track itself already holds the state after the batch's last frame
+    crop = best_crop(session.state.tracker, trk['id'])
+    if 'frame_best' in trk:
+        best_text, best_conf, version = trk['frame_best']
+    else:
+        track = session.state.tracker.all_tracks.get(trk['id'], trk)
+        best_text, best_conf, version = track.get('best_text', ''), track.get('best_conf', 0.0), crop[0] if crop else 0
+    obj = TrackedObject(
+        track_id=trk['id'],
+        box=trk['box'],
+        score=trk.get('conf', 0.0),
+        ocr=OCRResult(text=trk.get('text', ''), conf=trk.get('ocr_conf', 0.0)),
+        best=OCRResult(text=best_text, conf=best_conf),
+        predicted=trk.get('predicted', False),
+    )
+
+    # Tracks carry a reference to their best crop (etag = session generation, track id, version).
+    # The JPEG itself is embedded only the first time this session sends that version, and only
+    # while it is the crop the track holds (an older version of a batch gets the reference alone)
+    if crop is not None and version:
+        obj.crop = CropRef(etag=crop_etag(session.generation, trk['id'], version),
+                           url=crop_url(session.camera_id, trk['id']))
+        if embed_crops and version == crop[0] and session.sent_crops.get(trk['id']) != version:
+            data = crop_store.get(session.key, trk['id'], version, crop[1])
+            obj.crop_b64 = base64.b64encode(data).decode('utf-8')
+            session.sent_crops[trk['id']] = version
+    return obj
+
+def build_frame_result(session, tracks, frame_id, process_time_ms, embed_crops=True, dropped=0):
+    # Built while holding the session lock, its next frame mutates the track dicts
+    with encode_timer.time():
+        return FrameResult(
+            frame_id=frame_id,
+            camera_id=session.camera_id,
+            timestamp=time.time(),
+            objects=[to_tracked_object(session, trk, embed_crops) for trk in tracks],
+            processing_time_ms=round(process_time_ms, 2),
+            dropped=dropped,
+        )
+
+MSGPACK_TYPE = "application/msgpack"
+
+def wants_msgpack(accept):
+    return msgpack is not None and MSGPACK_TYPE in (accept or "")
+
+def render_result(result, accept=None):
+    # pydantic-core serializes the typed result straight to bytes, no Python-side cleanup pass
+    with serialize_timer.time():
+        if wants_msgpack(accept):
+            return Response(content=msgpack.packb(result.model_dump(exclude_none=True)), media_type=MSGPACK_TYPE)
+        return Response(content=result.model_dump_json(exclude_none=True), media_type="application/json")
+
+def decode_image(contents):
+    with decode_timer.time():
+        return cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
 
 
 @app.post("/process_frame")
 async def process_frame(
+    request: Request,
     file: UploadFile = File(...), 
-    frame_idx: int = 0
+    frame_idx: int = 0,
+    camera_id: str = "CAM_API"
 ):
     global pipeline_model, logger_service, monitor_service
     
     if pipeline_model is None:
         raise HTTPException(status_code=503, detail="Model chưa sẵn sàng.")
 
-    contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    with admission.admit():
+        contents = await file.read()
+        frame = await run_in_threadpool(decode_image, contents)
 
-    if frame is None:
-        raise HTTPException(status_code=400, detail="File ảnh lỗi.")
+        if frame is None:
+            raise HTTPException(status_code=400, detail="File ảnh lỗi.")
 
-    start_time = time.time()
-    
-    try:
-        _, tracks = pipeline_model.process_single_frame(frame, frame_idx)
+        try:
+            # Frames of one camera run in order, other cameras proceed in parallel. Only the
+            # newest waiting frame of a camera is kept, older ones are answered with 409
+            async with session_registry.session(camera_id, latest_only=True) as session:
+                start_time = time.time()
+                tracks = await inference_executor.submit(session.state, frame, frame_idx)
+                process_time_ms = (time.time() - start_time) * 1000
 
-        process_time_ms = (time.time() - start_time) * 1000
+                if monitor_service:
+                    monitor_service.update(process_time_ms, tracks)
 
-        if monitor_service:
-            monitor_service.update(process_time_ms, tracks)
+                if logger_service:
+                    for trk in tracks:
+                        if trk.get('text') or trk.get('ocr_conf', 0) > 0:
+                            logger_service.log_detection(trk, camera_id=camera_id)
 
-        if logger_service:
-            for trk in tracks:
-                if trk.get('text') or trk.get('ocr_conf', 0) > 0:
-                    logger_service.log_detection(trk, camera_id="CAM_API")
+                result = await run_in_threadpool(build_frame_result, session, tracks, frame_idx, process_time_ms)
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Lỗi xử lý: {str(e)}")
+        except FrameSuperseded:
+            raise
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=f"Lỗi xử lý: {str(e)}")
 
-    serializable_tracks = []
-    for trk in tracks:
-        trk_data = trk.copy()
-        if 'plate_img' in trk_data:
-            trk_data['plate_img'] = numpy_to_base64(trk_data['plate_img'])
-        if 'best_img' in trk_data:
-            trk_data['best_img'] = numpy_to_base64(trk_data['best_img'])
-        serializable_tracks.append(trk_data)
-
-    result = {
-        "processed_frame": None, 
-        "tracks": serializable_tracks,
-        "server_time_ms": process_time_ms
+    return render_result(result, request.headers.get("accept"))
+
+@app.post("/process_batch")
+async def process_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    start_frame_idx: int = 0,
+    camera_id: str = "CAM_API"
+):
+    # Consecutive frames of one camera in one request: one round trip and one detector
+    # pass for the whole batch (shared with other cameras' pending frames)
+    if pipeline_model is None:
+        raise HTTPException(status_code=503, detail="Model chưa sẵn sàng.")
+    if len(files) > max_batch_files:
+        raise HTTPException(status_code=413, detail=f"Tối đa {max_batch_files} ảnh mỗi request.")
+
+    # Admitted as a whole and never superseded: every frame of a batch gets its result
+    with admission.admit(len(files)):
+        contents = [await f.read() for f in files]
+        frames = await run_in_threadpool(lambda: [decode_image(c) for c in contents])
+        bad = [i for i, frame in enumerate(frames) if frame is None]
+        if bad:
+            raise HTTPException(status_code=400, detail=f"File ảnh lỗi: {bad}")
+
+        frame_indices = [start_frame_idx + i for i in range(len(frames))]
+        try:
+            async with session_registry.session(camera_id) as session:
+                start_time = time.time()
+                batch_tracks = await inference_executor.submit_batch(session.state, frames, frame_indices)
+                process_time_ms = (time.time() - start_time) * 1000
+                per_frame_ms = process_time_ms / len(frames)
+
+                for tracks in batch_tracks:
+                    if monitor_service:
+                        monitor_service.update(per_frame_ms, tracks)
+                    if logger_service:
+                        for trk in tracks:
+                            if trk.get('text') or trk.get('ocr_conf', 0) > 0:
+                                logger_service.log_detection(trk, camera_id=camera_id)
+
+                # Each crop is embedded once, in the first frame of the batch that shows the track's current crop
+                results = await run_in_threadpool(
+                    lambda: [build_frame_result(session, tracks, idx, per_frame_ms)
+                             for idx, tracks in zip(frame_indices, batch_tracks)])
+
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=f"Lỗi xử lý: {str(e)}")
+
+    result = FrameBatchResult(camera_id=camera_id, results=results, processing_time_ms=round(process_time_ms, 2))
+    return render_result(result, request.headers.get("accept"))
+
+@app.get("/crops/{camera_id}/{track_id}")
+async def get_crop(camera_id: str, track_id: int, request: Request):
+    # Looked up without get(), fetching a crop must not create or refresh a session
+    session = session_registry.sessions.get(camera_id) if session_registry else None
+    crop = best_crop(session.state.tracker, track_id) if session else None
+    if crop is None:
+        raise HTTPException(status_code=404, detail="Không có ảnh biển số.")
+
+    version, img = crop
+    etag = f'"{crop_etag(session.generation, track_id, version)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    data = await run_in_threadpool(crop_store.get, session.key, track_id, version, img)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process and its event loop respond. A failed model load is fatal, restart it
+    status_code = 500 if model_status["state"] == "failed" else 200
+    return JSONResponse(status_code=status_code, content={
+        "status": "failed" if status_code == 500 else "ok",
+        "models": model_status["state"],
+        "uptime_s": round(time.time() - started_at, 1),
+    })
+
+@app.get("/ready")
+async def ready():
+    # Readiness: models loaded and warmed up, traffic may be routed here
+    is_ready = model_status["state"] == "ready" and pipeline_model is not None
+    if is_ready and isinstance(inference_executor, WorkerPool) and not inference_executor.healthy():
+        model_status["state"] = "failed"
+        model_status["error"] = inference_executor.failed or "worker process exited"
+        is_ready = False
+    headers = {} if is_ready else {"Retry-After": "5"}
+    return JSONResponse(status_code=200 if is_ready else 503, headers=headers, content={
+        "ready": is_ready,
+        "models": model_status["state"],
+        "error": model_status["error"],
+        "load_timings_s": model_status["timings"],
+    })
+
+@app.get("/metrics")
+async def read_metrics():
+    text = monitor_service.render_metrics() if monitor_service else metrics_registry.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def read_stats():
+    return {
+        "admission": admission.stats(),
+        "sessions": session_registry.stats() if session_registry else {},
+        "executor": inference_executor.stats() if inference_executor else {},
+        "jobs": video_jobs.stats() if video_jobs else {},
     }
 
-    return clean_numpy_data(result)
+# Video jobs: upload the file once, the server decodes and runs it through the streaming
+# pipeline. Poll GET /jobs/{id} (progress, plates) and GET /jobs/{id}/results?since=N,
+# or read GET /jobs/{id}/stream (one FrameResult JSON per line until the job ends)
+def get_job(job_id):
+    job = video_jobs.get(job_id) if video_jobs else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không có job.")
+    return job
+
+def job_crop_url(job_id, track_id):
+    return f"/jobs/{job_id}/crops/{track_id}"
+
+def job_crop_ref(job, track_id):
+    crop = best_crop(job.state.tracker, track_id)
+    if crop is None:
+        return None
+    return CropRef(etag=crop_etag(job.job_id, track_id, crop[0]), url=job_crop_url(job.job_id, track_id))
+
+def job_frame_result(job, frame_idx, timestamp, tracks):
+    # Best read and crop etag from the snapshot taken when the frame was processed, a replay
+    # shows what a live client saw then (the crop URL serves the track's latest best crop)
+    objects = []
+    for trk in tracks:
+        crop = None
+        if trk['best_version']:
+            crop = CropRef(etag=crop_etag(job.job_id, trk['id'], trk['best_version']),
+                           url=job_crop_url(job.job_id, trk['id']))
+        objects.append(TrackedObject(
+            track_id=trk['id'],
+            box=trk['box'],
+            score=trk['conf'],
+            ocr=OCRResult(text=trk['text'], conf=trk['ocr_conf']),
+            best=OCRResult(text=trk['best_text'], conf=trk['best_conf']),
+            predicted=trk['predicted'],
+            crop=crop,
+        ))
+    return FrameResult(frame_id=frame_idx, camera_id=job.camera_id, timestamp=timestamp,
+                       objects=objects, processing_time_ms=0.0)
+
+def job_status(job):
+    plates = []
+    for track_id, (first, last) in list(job.seen.items()):
+        track = job.state.tracker.all_tracks.get(track_id)
+        if track is None or not track.get('best_text'):
+            continue
+        plates.append(PlateRead(track_id=track_id, text=track['best_text'], conf=track.get('best_conf', 0.0),
+                                first_frame=first, last_frame=last, crop=job_crop_ref(job, track_id)))
+    return JobStatus(job_id=job.job_id, camera_id=job.camera_id, status=job.status, frames_done=job.frames_done,
+                     total_frames=job.total_frames, progress=round(job.progress(), 4), fps=round(job.fps(), 1),
+                     error=job.error, plates=plates)
+
+@app.post("/jobs")
+async def create_job(file: UploadFile = File(...), camera_id: str = "JOB"):
+    if pipeline_model is None:
+        raise HTTPException(status_code=503, detail="Model chưa sẵn sàng.")
+    if video_jobs is None:
+        raise HTTPException(status_code=501, detail="Video job không hỗ trợ khi chạy nhiều worker (api.workers.count > 0).")
+
+    job_id, path = video_jobs.new_upload_path(file.filename)
+
+    def save_upload():
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(file.file, out, 1024 * 1024)
+
+    await run_in_threadpool(save_upload)
+    job = video_jobs.submit(job_id, path, camera_id)
+    return render_result(job_status(job))
+
+@app.get("/jobs/{job_id}")
+async def read_job(job_id: str):
+    return render_result(job_status(get_job(job_id)))
+
+@app.get("/jobs/{job_id}/results")
+async def read_job_results(job_id: str, request: Request, since: int = 0, limit: int = 500):
+    job = get_job(job_id)
+    # Status is read before the results: a finished status means the slice below is complete
+    status = job.status
+    start, chunk = job.results_since(since, max(1, limit))
+    results = await run_in_threadpool(lambda: [job_frame_result(job, *item) for item in chunk])
+    return render_result(JobResults(job_id=job_id, status=status, first=start, next=start + len(chunk),
+                                    results=results), request.headers.get("accept"))
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, since: int = 0):
+    job = get_job(job_id)
+
+    async def lines():
+        sent = since
+        while True:
+            finished = job.is_finished
+            sent, chunk = job.results_since(sent)
+            for item in chunk:
+                yield job_frame_result(job, *item).model_dump_json(exclude_none=True) + "\n"
+            sent += len(chunk)
+            if finished and sent >= job.frames_done:
+                break
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = video_jobs.cancel(job_id) if video_jobs else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không có job.")
+    return render_result(job_status(job))
+
+@app.get("/jobs/{job_id}/crops/{track_id}")
+async def get_job_crop(job_id: str, track_id: int, request: Request):
+    job = get_job(job_id)
+    crop = best_crop(job.state.tracker, track_id)
+    if crop is None:
+        raise HTTPException(status_code=404, detail="Không có ảnh biển số.")
+
+    version, img = crop
+    etag = f'"{crop_etag(job.job_id, track_id, version)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    data = await run_in_threadpool(crop_store.get, ('job', job.job_id), track_id, version, img)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+# WebSocket stream: client -> server binary messages = 8-byte big-endian frame id + JPEG bytes,
+# server -> client one FrameResult per processed frame (JSON text, or MessagePack bytes with
+# ?format=msgpack). Crops are never embedded: fetch crop.url when crop.etag changes.
+# A frame that fails is answered with {"frame_id", "error"}, a malformed message with {"error"}
+FRAME_HEADER = struct.Struct('>Q')
+
+class LatestFrameSlot:
+    # Holds only the newest frame of a connection. A frame arriving before the previous
+    # one was picked up replaces it, so a slow consumer drops frames instead of queueing them
+    def __init__(self, on_drop=None):
+        self.item = None
+        self.closed = False
+        self.dropped = 0
+        self.on_drop = on_drop
+        self.event = asyncio.Event()
+
+    def put(self, item):
+        if self.item is not None:
+            self.dropped += 1
+            if self.on_drop:
+                self.on_drop()
+        self.item = item
+        self.event.set()
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+    async def get(self):
+        while self.item is None and not self.closed:
+            self.event.clear()
+            await self.event.wait()
+        item, self.item = self.item, None
+        return item
+
+@app.websocket("/ws/{camera_id}")
+async def stream_frames(websocket: WebSocket, camera_id: str, format: str = "json"):
+    await websocket.accept()
+    if pipeline_model is None:
+        await websocket.close(code=1013, reason="Model chưa sẵn sàng.")
+        return
+
+    def count_drop():
+        admission.dropped += 1
+
+    slot = LatestFrameSlot(on_drop=count_drop)
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                data = message.get('bytes')
+                # Text messages and frames without a payload are not part of the protocol: answered, not fatal
+                if data is None or len(data) <= FRAME_HEADER.size:
+                    await websocket.send_json({"error": "Chỉ nhận message nhị phân: 8 byte frame id + ảnh JPEG."})
+                    continue
+                (frame_id,) = FRAME_HEADER.unpack_from(data)
+                slot.put((frame_id, data[FRAME_HEADER.size:]))
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            slot.close()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            item = await slot.get()
+            if item is None:
+                break
+            frame_id, payload = item
+
+            # Over the global limit the frame is shed, the connection's next frame takes its turn
+            if not admission.try_acquire():
+                continue
+            try:
+                frame = await run_in_threadpool(decode_image, payload)
+                if frame is None:
+                    await websocket.send_json({"frame_id": frame_id, "error": "File ảnh lỗi."})
+                    continue
+
+                # Tracker state comes from the camera's session, shared with /process_frame
+                async with session_registry.session(camera_id) as session:
+                    start_time = time.time()
+                    tracks = await inference_executor.submit(session.state, frame, session.frame_idx)
+                    process_time_ms = (time.time() - start_time) * 1000
+                    session.frame_idx += 1
+
+                    if monitor_service:
+                        monitor_service.update(process_time_ms, tracks)
+                    if logger_service:
+                        for trk in tracks:
+                            if trk.get('text') or trk.get('ocr_conf', 0) > 0:
+                                logger_service.log_detection(trk, camera_id=camera_id)
+                    result = build_frame_result(session, tracks, frame_id, process_time_ms, embed_crops=False,
+                                                dropped=slot.dropped)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # One bad frame (inference error, worker timeout) is reported, the stream goes on
+                import traceback
+                traceback.print_exc()
+                await websocket.send_json({"frame_id": frame_id, "error": f"Lỗi xử lý: {str(e)}"})
+                continue
+            finally:
+                admission.release()
+
+            if format == "msgpack" and msgpack is not None:
+                with serialize_timer.time():
+                    payload = msgpack.packb(result.model_dump(exclude_none=True))
+                await websocket.send_bytes(payload)
+            else:
+                with serialize_timer.time():
+                    payload = result.model_dump_json(exclude_none=True)
+                await websocket.send_text(payload)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,77 @@
+# benchmarks/bench_detect_scale.py
+# Thời gian detect / frame và recall khi detect trên ảnh thu nhỏ (so với detect trên frame gốc)
+import os
+import sys
+import glob
+import time
+import argparse
+import cv2
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(os.path.join(project_root, 'src'))
+
+from core.detector import PlateDetector, DetectionRegion
+from core.tracker import iou_matrix, greedy_assignment
+
+def load_frames(pattern, video, max_frames, resize_to):
+    frames = [cv2.imread(p) for p in sorted(glob.glob(pattern))]
+    frames = [f for f in frames if f is not None]
+    if video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+
+    if resize_to:
+        # Simulate a high-resolution camera from the small test images
+        frames = [cv2.resize(f, (resize_to, int(f.shape[0] * resize_to / f.shape[1])), interpolation=cv2.INTER_CUBIC)
+                  for f in frames]
+    return frames
+
+def recall(reference, candidate, iou_threshold=0.5):
+    total = matched = 0
+    for ref, cand in zip(reference, candidate):
+        total += len(ref)
+        ious = iou_matrix([d['box'] for d in ref], [d['box'] for d in cand])
+        matched += len(greedy_assignment(ious, iou_threshold))
+    return matched / total if total else 1.0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', default=os.path.join(project_root, 'models', 'yolo', 'weights', 'best.pt'))
+    parser.add_argument('--images', default=os.path.join(project_root, 'assets', '*.jpg'))
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--max-frames', type=int, default=64)
+    parser.add_argument('--resize-to', type=int, default=3840, help='frame width to test at, 0 = keep')
+    parser.add_argument('--scales', default='1.0,0.75,0.5,0.33,0.25')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.video, args.max_frames, args.resize_to)
+    if not frames:
+        print("Không có frame nào để test.")
+        return
+    print(f"{len(frames)} frames at {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    detector = PlateDetector(model_path=args.weights)
+    reference = [detector.detect(f) for f in frames]
+
+    for scale in [float(s) for s in args.scales.split(',')]:
+        region = DetectionRegion(scale=scale)
+        outputs = [detector.detect(f, region) for f in frames]
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            for f in frames:
+                detector.detect(f, region)
+        ms = (time.perf_counter() - start) * 1000 / (args.repeats * len(frames))
+
+        print(f"scale {scale:<5} {ms:8.2f} ms/frame | recall vs full-res {recall(reference, outputs):.1%}"
+              f" | {sum(len(o) for o in outputs)} boxes")
+
+if __name__ == "__main__":
+    main()
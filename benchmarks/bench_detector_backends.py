@@ -0,0 +1,81 @@
+# benchmarks/bench_detector_backends.py
+# So sánh tốc độ detector trên CPU: Ultralytics (PyTorch) vs ONNX Runtime (FP32 / INT8)
+import os
+import sys
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(os.path.join(project_root, 'src'))
+
+from core.detector import PlateDetector
+from core.tracker import iou_matrix, greedy_assignment
+
+def load_frames(pattern, video, max_frames):
+    frames = [cv2.imread(p) for p in sorted(glob.glob(pattern))]
+    frames = [f for f in frames if f is not None]
+    if video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    return frames
+
+def time_detector(detector, frames, batch_size, repeats):
+    detector.detect_batch(frames[:batch_size]) # warmup
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, len(frames), batch_size):
+            detector.detect_batch(frames[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000 / (repeats * len(frames))
+
+def agreement(reference, candidate):
+    # Fraction of reference boxes matched by the candidate at IoU >= 0.9
+    total = matched = 0
+    for ref, cand in zip(reference, candidate):
+        total += len(ref)
+        ious = iou_matrix([d['box'] for d in ref], [d['box'] for d in cand])
+        matched += len(greedy_assignment(ious, 0.9))
+    return matched / total if total else 1.0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', default=os.path.join(project_root, 'models', 'yolo', 'weights', 'best.pt'))
+    parser.add_argument('--images', default=os.path.join(project_root, 'assets', '*.jpg'))
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--max-frames', type=int, default=64)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.video, args.max_frames)
+    print(f"{len(frames)} frames")
+
+    configs = [
+        ('ultralytics', dict(backend='torch')),
+        ('onnx fp32', dict(backend='onnx')),
+        ('onnx int8', dict(backend='onnx', int8=True)),
+    ]
+
+    reference = None
+    for name, kwargs in configs:
+        detector = PlateDetector(model_path=args.weights, **kwargs)
+        outputs = [detector.detect(f) for f in frames]
+        if reference is None:
+            reference = outputs
+
+        for batch_size in (1, 8):
+            ms = time_detector(detector, frames, batch_size, args.repeats)
+            print(f"{name:<12} batch={batch_size:<2} {ms:8.2f} ms/frame ({1000 / ms:6.1f} fps)"
+                  f" | boxes matching ultralytics: {agreement(reference, outputs):.1%}")
+
+if __name__ == "__main__":
+    main()
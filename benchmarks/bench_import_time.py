@@ -0,0 +1,62 @@
+# benchmarks/bench_import_time.py
+# Thời gian import (process mới mỗi lần) của các entry point, và các thư viện nặng bị kéo theo lúc import.
+# Backend (ultralytics/torch, paddleocr/paddle) chỉ nên được import khi tạo model.
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+HEAVY = ['torch', 'ultralytics', 'paddle', 'paddleocr', 'onnxruntime', 'easyocr']
+
+TARGETS = {
+    'pipeline': "import pipeline",
+    'api': "import api.main",
+    'camera_service': "import src.services.camera_service",
+    # So sánh: chi phí nếu backend được import ngay
+    'ultralytics': "import ultralytics",
+    'paddleocr': "import paddleocr",
+}
+
+PROBE = """
+import sys, time, json
+sys.path[:0] = [{root!r}, {src!r}]
+start = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"s": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def run_once(stmt):
+    code = PROBE.format(root=project_root, src=os.path.join(project_root, 'src'), stmt=stmt, heavy=HEAVY)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=project_root)
+    if out.returncode != 0:
+        return None, out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"
+    return json.loads(out.stdout.strip().splitlines()[-1]), None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('targets', nargs='*', default=list(TARGETS))
+    args = parser.parse_args()
+
+    for name in args.targets:
+        times, heavy, error = [], [], None
+        for _ in range(args.repeats):
+            result, error = run_once(TARGETS[name])
+            if result is None:
+                break
+            times.append(result['s'])
+            heavy = result['heavy']
+        if error:
+            print(f"{name:<16} lỗi: {error}")
+            continue
+        print(f"{name:<16} median {statistics.median(times) * 1000:8.1f} ms | min {min(times) * 1000:8.1f} ms"
+              f" | heavy: {', '.join(heavy) or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_ocr_paths.py
+# So sánh OCR đầy đủ (det + cls + rec) với chế độ rec-only trên ảnh trong assets/
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(os.path.join(project_root, 'src'))
+
+from core.detector import PlateDetector, get_plate_crop
+from core.ocr_paddle import LicensePlateOCR
+from core.image_utils import preprocess_plate
+
+def collect_plates(detector, image_paths):
+    plates = []
+    for path in image_paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        for det in detector.detect(frame):
+            plates.append((os.path.basename(path), preprocess_plate(get_plate_crop(frame, det))))
+    return plates
+
+def run_path(ocr, plates, repeats):
+    images = [img for _, img in plates]
+    ocr.predict_batch(images[:1]) # warmup
+
+    per_crop_ms = []
+    for _ in range(repeats):
+        for img in images:
+            start = time.perf_counter()
+            ocr.predict(img)
+            per_crop_ms.append((time.perf_counter() - start) * 1000)
+
+    batch_ms = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        texts = ocr.predict_batch(images)
+        batch_ms.append((time.perf_counter() - start) * 1000)
+
+    return texts, per_crop_ms, batch_ms
+
+def accuracy(plates, texts, labels):
+    found = {}
+    for (name, _), (text, _) in zip(plates, texts):
+        found.setdefault(name, set()).add(text)
+
+    total = hits = 0
+    for name, expected in labels.items():
+        for plate in expected:
+            total += 1
+            hits += plate in found.get(name, set())
+    return hits / total if total else None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', default=os.path.join(project_root, 'models', 'yolo', 'weights', 'best.pt'))
+    parser.add_argument('--images', default=os.path.join(project_root, 'assets', '*.jpg'))
+    parser.add_argument('--labels', default=None, help='JSON {"test_image.jpg": ["AB12CDE"]}')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    detector = PlateDetector(model_path=args.weights)
+    plates = collect_plates(detector, sorted(glob.glob(args.images)))
+    if not plates:
+        print("Không tìm thấy biển số nào trong ảnh test.")
+        return
+    print(f"{len(plates)} plate crops")
+
+    labels = None
+    if args.labels:
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+
+    outputs = {}
+    for name, rec_only in [('det+cls+rec', False), ('rec-only', True)]:
+        ocr = LicensePlateOCR(rec_only=rec_only)
+        texts, per_crop_ms, batch_ms = run_path(ocr, plates, args.repeats)
+        outputs[name] = texts
+
+        line = (f"{name:<12} per-crop {np.mean(per_crop_ms):7.2f} ms (p50 {np.percentile(per_crop_ms, 50):.2f})"
+                f" | batch {np.mean(batch_ms):8.2f} ms for {len(plates)} crops")
+        if labels:
+            line += f" | accuracy {accuracy(plates, texts, labels):.2%}"
+        print(line)
+
+    agree = sum(a[0] == b[0] for a, b in zip(outputs['det+cls+rec'], outputs['rec-only']))
+    print(f"Agreement rec-only vs full: {agree}/{len(plates)}")
+    for (name, _), full, rec in zip(plates, outputs['det+cls+rec'], outputs['rec-only']):
+        print(f"  {name:<20} {full[0]:<10} {rec[0]:<10}")
+
+if __name__ == "__main__":
+    main()
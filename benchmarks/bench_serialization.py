@@ -0,0 +1,107 @@
+# benchmarks/bench_serialization.py
+# Thời gian serialize kết quả 1 frame: dict + clean_numpy_data + base64 (cũ) vs FrameResult (src/schemas.py)
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import cv2
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from src.schemas import OCRResult, CropRef, TrackedObject, FrameResult
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def make_tracks(n, rng):
+    tracks = []
+    for i in range(n):
+        x, y = rng.integers(0, 1800), rng.integers(0, 1000)
+        crop = rng.integers(0, 255, (64, 200, 3), dtype=np.uint8)
+        tracks.append({
+            'id': np.int64(i + 1),
+            'box': [np.int64(x), np.int64(y), np.int64(x + 120), np.int64(y + 40)],
+            'conf': np.float32(0.87),
+            'text': "51F12345", 'ocr_conf': np.float32(0.93),
+            'best_text': "51F12345", 'best_conf': np.float32(0.95),
+            'lost_count': 0, 'updated': True,
+            'plate_img': crop, 'best_img': crop,
+        })
+    return tracks
+
+# --- Đường cũ của api/main.py (trước khi dùng schemas)
+def numpy_to_base64(img_array):
+    if img_array is None: return None
+    _, buffer = cv2.imencode('.jpg', img_array)
+    return base64.b64encode(buffer).decode('utf-8')
+
+def clean_numpy_data(data):
+    if isinstance(data, dict):
+        return {k: clean_numpy_data(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [clean_numpy_data(v) for v in data]
+    elif isinstance(data, (np.int64, np.int32, np.int_)): return int(data)
+    elif isinstance(data, (np.float32, np.float64)): return float(data)
+    elif isinstance(data, np.ndarray): return data.tolist()
+    else: return data
+
+def legacy(tracks):
+    serializable_tracks = []
+    for trk in tracks:
+        trk_data = trk.copy()
+        trk_data['plate_img'] = numpy_to_base64(trk_data['plate_img'])
+        trk_data['best_img'] = numpy_to_base64(trk_data['best_img'])
+        serializable_tracks.append(trk_data)
+    result = {"processed_frame": None, "tracks": serializable_tracks, "server_time_ms": 12.3}
+    return json.dumps(clean_numpy_data(result)).encode('utf-8')
+
+# --- Đường mới: FrameResult, crop chỉ là tham chiếu (ảnh đã gửi ở frame trước)
+def build(tracks):
+    return FrameResult(
+        frame_id=1, camera_id="CAM_01", timestamp=time.time(), processing_time_ms=12.3,
+        objects=[TrackedObject(
+            track_id=trk['id'], box=trk['box'], score=trk['conf'],
+            ocr=OCRResult(text=trk['text'], conf=trk['ocr_conf']),
+            best=OCRResult(text=trk['best_text'], conf=trk['best_conf']),
+            crop=CropRef(etag=f"1.{trk['id']}.1", url=f"/crops/CAM_01/{trk['id']}"),
+        ) for trk in tracks],
+    )
+
+def typed_json(tracks):
+    return build(tracks).model_dump_json(exclude_none=True).encode('utf-8')
+
+def typed_msgpack(tracks):
+    return msgpack.packb(build(tracks).model_dump(exclude_none=True))
+
+def bench(fn, tracks, repeats):
+    fn(tracks) # warmup
+    start = time.perf_counter()
+    for _ in range(repeats):
+        payload = fn(tracks)
+    return (time.perf_counter() - start) * 1000 / repeats, len(payload)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    tracks = make_tracks(args.tracks, np.random.default_rng(0))
+    paths = [('legacy dict + base64', legacy), ('FrameResult json', typed_json)]
+    if msgpack is not None:
+        paths.append(('FrameResult msgpack', typed_msgpack))
+
+    print(f"{args.tracks} tracks / frame")
+    for name, fn in paths:
+        ms, size = bench(fn, tracks, args.repeats)
+        print(f"{name:<22} {ms:8.3f} ms/frame {size:8d} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,227 @@
-from ultralytics import YOLO
 import cv2
 import numpy as np
+from core.detector_onnx import nms
 
-class PlateDetector:
-    def __init__(self, model_path, conf_threshold=0.32):
+class UltralyticsBackend:
+    def __init__(self, model_path):
+        # Imported on first use: ultralytics pulls in torch, seconds of import time
+        from ultralytics import YOLO
         self.model = YOLO(model_path)
-        self.conf = conf_threshold
 
-    def detect(self, image):
-        results = self.model(image, conf=self.conf, verbose=False)
-        detections = []
+    def predict(self, images, conf):
+        # One forward pass for the whole batch, results come back in input order
+        results = self.model(list(images), conf=conf, verbose=False)
 
+        outputs = []
         for result in results:
             boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                conf = float(box.conf[0].cpu().numpy())
-
-                h_img, w_img = image.shape[:2]
-                
-                # Add paddings 
-                padding = 10 
-                x1 = max(0, x1 - padding)
-                y1 = max(0, y1 - padding)
-                x2 = min(w_img, x2 + padding)
-                y2 = min(h_img, y2 + padding)
-                plate_crop = image[y1:y2, x1:x2]
-
-                h_crop, w_crop = plate_crop.shape[:2]
-                if h_crop < 64: 
-                    scale = 64 / h_crop
-                    plate_crop = cv2.resize(plate_crop, (int(w_crop * scale), 64), interpolation=cv2.INTER_CUBIC)
-                
-                detections.append({
-                    'box': [x1, y1, x2, y2],
-                    'plate_img': plate_crop,
-                    'conf': conf
-                })
-        
-        return detections
\ No newline at end of file
+            if boxes is None or len(boxes) == 0:
+                outputs.append((np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)))
+                continue
+            # Move all boxes off the model output at once
+            outputs.append((boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy()))
+        return outputs
+
+class DetectionRegion:
+    # Per-camera view handed to the detector: ROI polygon (full-frame pixels) and detection scale.
+    # max_side caps the long side of the detection image, so 4K streams are shrunk once
+    # here (INTER_AREA) instead of being passed to the model at full size.
+    def __init__(self, roi=None, scale=1.0, max_side=0):
+        self.polygon = np.array(roi, dtype=np.int32).reshape(-1, 2) if roi else None
+        self.scale = float(scale)
+        self.max_side = int(max_side or 0)
+        self._geometry = {} # frame (h, w) -> (bbox, mask or None, scale)
+
+    def _get_geometry(self, h, w):
+        key = (h, w)
+        if key not in self._geometry:
+            mask = None
+            x1, y1, x2, y2 = 0, 0, w, h
+            if self.polygon is not None:
+                x1, y1 = np.clip(self.polygon.min(axis=0), 0, [w, h])
+                x2, y2 = np.clip(self.polygon.max(axis=0) + 1, 0, [w, h])
+                if x2 <= x1 or y2 <= y1:
+                    # Otherwise every frame would be an empty view and the camera would silently detect nothing
+                    raise ValueError(f"roi {self.polygon.tolist()} nằm ngoài khung hình {w}x{h}")
+                mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+                cv2.fillPoly(mask, [self.polygon - [x1, y1]], 255)
+                # A rectangular ROI needs no masking, the crop is enough
+                if cv2.countNonZero(mask) == mask.size:
+                    mask = None
+
+            scale = self.scale
+            long_side = max(x2 - x1, y2 - y1)
+            if self.max_side and long_side * scale > self.max_side:
+                scale = self.max_side / float(long_side)
+
+            self._geometry[key] = ((int(x1), int(y1), int(x2), int(y2)), mask, scale)
+        return self._geometry[key]
+
+    def clip_window(self, window, shape):
+        # Track window cut down to the ROI bounding box, None when nothing of it is left to search
+        (x1, y1, x2, y2), _, scale = self._get_geometry(*shape[:2])
+        wx1, wy1 = max(window[0], x1), max(window[1], y1)
+        wx2, wy2 = min(window[2], x2), min(window[3], y2)
+        if min(wx2 - wx1, wy2 - wy1) * scale < 1:
+            return None
+        return [wx1, wy1, wx2, wy2]
+
+    def prepare(self, image, window=None):
+        # window = clipped track window (see clip_window), searched at the same scale as the full view.
+        # It is not masked: boxes outside the polygon are dropped in to_frame
+        (x1, y1, x2, y2), mask, scale = self._get_geometry(*image.shape[:2])
+        if window is not None:
+            view = image[window[1]:window[3], window[0]:window[2]]
+        else:
+            view = image[y1:y2, x1:x2]
+            if mask is not None:
+                view = cv2.bitwise_and(view, view, mask=mask)
+        if scale != 1.0:
+            view = cv2.resize(view, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return view
+
+    def to_frame(self, xyxy, confs, shape, window=None):
+        # Map boxes found on the prepared view back to full-frame coordinates
+        (x1, y1, _, _), mask, scale = self._get_geometry(*shape[:2])
+        ox, oy = (window[0], window[1]) if window is not None else (x1, y1)
+        xyxy = xyxy / scale + np.array([ox, oy, ox, oy], dtype=np.float32)
+
+        if mask is not None and len(xyxy):
+            # Keep plates whose center lies inside the polygon
+            cx = np.clip(((xyxy[:, 0] + xyxy[:, 2]) / 2 - x1).astype(int), 0, mask.shape[1] - 1)
+            cy = np.clip(((xyxy[:, 1] + xyxy[:, 3]) / 2 - y1).astype(int), 0, mask.shape[0] - 1)
+            inside = mask[cy, cx] > 0
+            xyxy, confs = xyxy[inside], confs[inside]
+        return xyxy, confs
+
+def track_windows(boxes, shape, scale=2.5, min_size=160):
+    # Search windows around tracked plates: each box grown by `scale` (at least
+    # min_size px), clipped to the frame, overlapping windows merged into one
+    h, w = shape[:2]
+    windows = []
+    for x1, y1, x2, y2 in boxes:
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        half_w = max((x2 - x1) * scale, min_size) / 2
+        half_h = max((y2 - y1) * scale, min_size) / 2
+        windows.append([max(0, int(cx - half_w)), max(0, int(cy - half_h)),
+                        min(w, int(cx + half_w)), min(h, int(cy + half_h))])
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(windows)):
+            for j in range(i + 1, len(windows)):
+                a, b = windows[i], windows[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    windows[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del windows[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [win for win in windows if win[2] > win[0] and win[3] > win[1]]
+
+class PlateDetector:
+    def __init__(self, model_path, conf_threshold=0.32, backend='torch', int8=False, imgsz=640, iou_threshold=0.5):
+        self.conf = conf_threshold
+        # Duplicate suppression when the windows of one frame find the same plate
+        self.iou_threshold = iou_threshold
+        if backend == 'onnx':
+            from core.detector_onnx import OnnxBackend
+            self.backend = OnnxBackend(model_path, imgsz=imgsz, int8=int8)
+        else:
+            self.backend = UltralyticsBackend(model_path)
+
+    def detect(self, image, region=None):
+        return self.detect_batch([image], [region])[0]
+
+    def warmup(self, frame_shape=(720, 1280, 3), batch_sizes=(1,)):
+        # The first call of each batch size builds the graph / picks kernels, do it before real frames
+        frame = np.full(frame_shape, 114, dtype=np.uint8)
+        for n in batch_sizes:
+            self.detect_batch([frame] * n)
+
+    def detect_batch(self, images, regions=None, windows=None):
+        # windows[i] = list of [x1, y1, x2, y2] to search instead of the whole frame
+        # (see track_windows), None = full-frame scan through the region
+        if not images:
+            return []
+        if regions is None:
+            regions = [None] * len(images)
+        if windows is None:
+            windows = [None] * len(images)
+
+        # The model sees the ROI / scaled view or the track windows, boxes and crops
+        # refer to the full-resolution frame. Every view of the batch goes in one pass
+        views, owners = [], []
+        for i, (image, region, wins) in enumerate(zip(images, regions, windows)):
+            if wins is None:
+                views.append(region.prepare(image) if region else image)
+                owners.append((i, None))
+            else:
+                # Windows go through the same ROI and scale as the full view
+                for win in wins:
+                    if region:
+                        win = region.clip_window(win, image.shape)
+                        if win is None:
+                            continue
+                        views.append(region.prepare(image, win))
+                    else:
+                        views.append(image[win[1]:win[3], win[0]:win[2]])
+                    owners.append((i, win))
+        outputs = self.backend.predict(views, self.conf) if views else []
+
+        parts = [[] for _ in images]
+        for (i, win), (xyxy, confs) in zip(owners, outputs):
+            if regions[i]:
+                xyxy, confs = regions[i].to_frame(xyxy, confs, images[i].shape, win)
+            elif win is not None:
+                xyxy = xyxy + np.array([win[0], win[1], win[0], win[1]], dtype=np.float32)
+            parts[i].append((xyxy, confs))
+
+        detections = []
+        for image, image_parts in zip(images, parts):
+            if len(image_parts) == 1:
+                xyxy, confs = image_parts[0]
+            elif image_parts:
+                xyxy = np.concatenate([p[0] for p in image_parts]).astype(np.float32)
+                confs = np.concatenate([p[1] for p in image_parts])
+                keep = nms(xyxy, confs, self.iou_threshold)
+                xyxy, confs = xyxy[keep], confs[keep]
+            else:
+                xyxy, confs = np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)
+            detections.append(self._to_detections(xyxy, confs, image))
+        return detections
+
+    def _to_detections(self, xyxy, confs, image):
+        if len(xyxy) == 0:
+            return []
+
+        xyxy = xyxy.astype(int)
+        h_img, w_img = image.shape[:2]
+
+        # Add paddings
+        padding = 10
+        xyxy[:, :2] -= padding
+        xyxy[:, 2:] += padding
+        xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, w_img)
+        xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, h_img)
+
+        # Crops are cut later, only for the detections that need them (see get_plate_crop)
+        return [{'box': box, 'conf': conf} for box, conf in zip(xyxy.tolist(), confs.tolist())]
+
+def crop_plate(image, box):
+    x1, y1, x2, y2 = box
+    plate_crop = image[y1:y2, x1:x2]
+
+    h_crop, w_crop = plate_crop.shape[:2]
+    if 0 < h_crop < 64:
+        scale = 64 / h_crop
+        plate_crop = cv2.resize(plate_crop, (int(w_crop * scale), 64), interpolation=cv2.INTER_CUBIC)
+    return plate_crop
+
+def get_plate_crop(image, det):
+    # Cut on first use and keep it on the detection, so OCR, tracker and logger share one crop
+    if det.get('plate_img') is None:
+        det['plate_img'] = crop_plate(image, det['box'])
+    return det['plate_img']
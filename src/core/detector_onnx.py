@@ -0,0 +1,128 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import cv2
+import numpy as np
+
+DEFAULT_CACHE_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'models', 'yolo', 'cache'
+)
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def export_onnx(weights_path, imgsz=640, int8=False, cache_root=DEFAULT_CACHE_ROOT):
+    # One export per weights file: the cache key is the hash of best.pt, so retrained weights re-export
+    cache_dir = os.path.join(cache_root, file_sha256(weights_path)[:16])
+    fp32_path = os.path.join(cache_dir, f"plate_{imgsz}.onnx")
+    target = os.path.join(cache_dir, f"plate_{imgsz}_int8.onnx") if int8 else fp32_path
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Several processes (API workers) may export at once: each one works in its own temp
+    # directory / file and publishes with os.replace, a reader never sees a half-written model
+    if not os.path.exists(fp32_path):
+        from ultralytics import YOLO
+        print(f"Export ONNX: {weights_path} -> {fp32_path}")
+        tmp_dir = tempfile.mkdtemp(prefix="export_", dir=cache_dir)
+        try:
+            # Ultralytics writes the .onnx next to the weights, so the weights are copied in first
+            tmp_weights = os.path.join(tmp_dir, os.path.basename(weights_path))
+            shutil.copy2(weights_path, tmp_weights)
+            exported = YOLO(tmp_weights).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+            os.replace(exported, fp32_path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if int8 and not os.path.exists(target):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QUInt8)
+        os.replace(tmp_path, target)
+
+    return target
+
+def letterbox(image, size, color=(114, 114, 114)):
+    # Same resize + centered padding as Ultralytics, returns the NCHW blob and how to undo it
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+
+    blob = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).transpose(2, 0, 1).astype(np.float32) / 255.0
+    return blob, (scale, left, top)
+
+def nms(boxes, scores, iou_threshold):
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind='stable')
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        # IoU of the current best box against every remaining box at once
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-6)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+class OnnxBackend:
+    def __init__(self, weights_path, imgsz=640, int8=False, cache_root=DEFAULT_CACHE_ROOT,
+                 providers=None, iou_threshold=0.7, max_det=300):
+        import onnxruntime as ort
+
+        self.imgsz = imgsz
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+        self.model_path = export_onnx(weights_path, imgsz=imgsz, int8=int8, cache_root=cache_root)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # e.g. ['OpenVINOExecutionProvider', 'CPUExecutionProvider'] with onnxruntime-openvino installed
+        self.session = ort.InferenceSession(self.model_path, options, providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, images, conf):
+        blobs, metas = zip(*[letterbox(image, self.imgsz) for image in images])
+        # Output: (batch, 4 + num_classes, anchors) with boxes as cx, cy, w, h
+        output = self.session.run(None, {self.input_name: np.stack(blobs)})[0]
+        return [self._decode(pred, meta, image.shape, conf) for pred, meta, image in zip(output, metas, images)]
+
+    def _decode(self, pred, meta, shape, conf):
+        pred = pred.T
+        scores = pred[:, 4:].max(axis=1)
+        keep = scores > conf
+        pred, scores = pred[keep], scores[keep]
+
+        boxes = np.empty((len(pred), 4), dtype=np.float32)
+        boxes[:, :2] = pred[:, :2] - pred[:, 2:4] / 2
+        boxes[:, 2:] = pred[:, :2] + pred[:, 2:4] / 2
+
+        idx = nms(boxes, scores, self.iou_threshold)[:self.max_det]
+        boxes, scores = boxes[idx], scores[idx]
+
+        # Undo letterbox back to source pixels
+        scale, pad_x, pad_y = meta
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - pad_x) / scale, 0, shape[1])
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - pad_y) / scale, 0, shape[0])
+        return boxes, scores
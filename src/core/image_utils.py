@@ -87,4 +87,40 @@ def draw_results(image, detections):
         cv2.rectangle(img_copy, (x1, y1 - 30), (x1 + w, y1), (0, 255, 0), -1)
         cv2.putText(img_copy, label, (x1, y1 - 10), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-    return img_copy
\ No newline at end of file
+    return img_copy
+
+def split_plate_lines(plate_img, max_single_line_ratio=3.0, valley_ratio=0.25):
+    if plate_img is None or plate_img.size == 0:
+        return []
+
+    h, w = plate_img.shape[:2]
+    # Long one-row plates never need a split
+    if h == 0 or w / h > max_single_line_ratio:
+        return [plate_img]
+
+    if len(plate_img.shape) == 3:
+        gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = plate_img
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Characters are the minority class, make them the foreground
+    if cv2.countNonZero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+
+    # Row projection: number of character pixels on each row
+    profile = binary.sum(axis=1).astype(np.float32) / 255.0
+    k = max(1, h // 20)
+    profile = np.convolve(profile, np.ones(k, dtype=np.float32) / k, mode='same')
+
+    # The gap between the two rows sits somewhere in the middle band
+    lo, hi = int(h * 0.3), int(h * 0.7)
+    if hi <= lo:
+        return [plate_img]
+
+    split = lo + int(np.argmin(profile[lo:hi]))
+    peak = min(profile[:split].max(), profile[split:].max())
+    if peak <= 0 or profile[split] > valley_ratio * peak:
+        return [plate_img]
+
+    return [plate_img[:split], plate_img[split:]]
@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+
+class MotionGate:
+    # Cheap "did anything move" check run before the detector. Frames are compared
+    # as small blurred grayscale images against the frame of the last detection,
+    # so a static gate / parking camera costs one resize + absdiff per frame.
+    def __init__(self, roi=None, width=160, pixel_threshold=25, min_changed=0.002, max_skip=25, idle_frames=5):
+        self.polygon = np.array(roi, dtype=np.float32).reshape(-1, 2) if roi else None
+        self.width = width
+        self.pixel_threshold = pixel_threshold # gray level change counted as motion
+        self.min_changed = min_changed # fraction of ROI pixels that must change
+        self.max_skip = max_skip # force a detection after this many skipped frames
+        self.idle_frames = idle_frames # skipped frames in a row after which the scene counts as idle
+
+        self.reference = None
+        self.changed = None # changed pixels of the last checked frame (small scale), None = no reference yet
+        self.fx = 1.0
+        self.woke = False
+        self.skipped_in_row = 0
+        self._masks = {} # small (h, w) -> ROI mask or None
+
+        self.checked = 0
+        self.skipped = 0
+
+    def _small_gray(self, frame):
+        h, w = frame.shape[:2]
+        fx = self.width / float(w)
+        small = cv2.resize(frame, (self.width, max(1, int(round(h * fx)))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Blur away sensor noise and compression artefacts
+        return cv2.GaussianBlur(small, (5, 5), 0), fx
+
+    def _get_mask(self, shape, fx):
+        if self.polygon is None:
+            return None
+        if shape not in self._masks:
+            mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(mask, [np.round(self.polygon * fx).astype(np.int32)], 255)
+            if not mask.any():
+                # An empty mask never sees motion: the camera would only wake up every max_skip frames
+                raise ValueError(f"roi {self.polygon.astype(int).tolist()} nằm ngoài khung hình")
+            self._masks[shape] = mask
+        return self._masks[shape]
+
+    def should_detect(self, frame):
+        self.checked += 1
+        gray, fx = self._small_gray(frame)
+        mask = self._get_mask(gray.shape, fx)
+
+        moved = True
+        self.changed, self.fx = None, fx
+        if self.reference is not None and self.reference.shape == gray.shape:
+            changed = cv2.absdiff(gray, self.reference) > self.pixel_threshold
+            if mask is not None:
+                changed &= mask > 0
+                area = max(1, cv2.countNonZero(mask))
+            else:
+                area = changed.size
+            moved = np.count_nonzero(changed) >= self.min_changed * area
+            self.changed = changed
+
+        # Motion right after an idle stretch: something entered the scene
+        self.woke = moved and self.skipped_in_row >= self.idle_frames
+        if moved or self.skipped_in_row >= self.max_skip:
+            # Compare against the last detected frame, so slow changes still add up
+            self.reference = gray
+            self.skipped_in_row = 0
+            return True
+
+        self.skipped += 1
+        self.skipped_in_row += 1
+        return False
+
+    def moved_outside(self, boxes, zone=None):
+        # Motion of the last checked frame that the given boxes (full-frame pixels) don't
+        # explain, optionally only inside a zone polygon: a vehicle nobody tracks yet
+        if self.changed is None:
+            return True
+        fresh = self.changed.copy()
+        for x1, y1, x2, y2 in boxes:
+            fresh[int(y1 * self.fx):int(np.ceil(y2 * self.fx)) + 1, int(x1 * self.fx):int(np.ceil(x2 * self.fx)) + 1] = False
+        if zone is not None:
+            zone_mask = np.zeros(fresh.shape, dtype=np.uint8)
+            cv2.fillPoly(zone_mask, [np.round(np.array(zone, dtype=np.float32).reshape(-1, 2) * self.fx).astype(np.int32)], 255)
+            fresh &= zone_mask > 0
+        return np.count_nonzero(fresh) >= self.min_changed * fresh.size
+
+    def skip_rate(self):
+        return self.skipped / self.checked if self.checked else 0.0
@@ -1,67 +1,263 @@
-from paddleocr import PaddleOCR
+import copy
+import hashlib
+import tempfile
+import cv2
+import numpy as np
 import logging
+import os
+import yaml
+
+from core.image_utils import split_plate_lines
+
+BUNDLED_REC_MODEL_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'models', 'paddleocr'
+)
+# Optional text detector / angle classifier for the full (det + rec) mode
+BUNDLED_DET_MODEL_DIR = os.path.join(BUNDLED_REC_MODEL_DIR, 'det')
+BUNDLED_CLS_MODEL_DIR = os.path.join(BUNDLED_REC_MODEL_DIR, 'cls')
+# Character dictionaries converted from inference.yml, keyed by content
+DICT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'alpr_paddleocr')
+
+def load_rec_model_config(model_dir):
+    # Exported inference models ship their character set and input shape in inference.yml,
+    # PaddleOCR expects the dictionary as a plain text file
+    params_path = os.path.join(model_dir, 'inference.pdiparams')
+    yml_path = os.path.join(model_dir, 'inference.yml')
+    if not os.path.exists(params_path) or not os.path.exists(yml_path):
+        return None
+
+    with open(yml_path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+
+    # Written to a temp cache, not next to the model: the model directory may be read-only
+    content = "\n".join(str(c) for c in cfg['PostProcess']['character_dict']) + "\n"
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+    dict_path = os.path.join(DICT_CACHE_DIR, f"plate_dict_{digest}.txt")
+    if not os.path.exists(dict_path):
+        os.makedirs(DICT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{dict_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, dict_path)
+
+    image_shape = [3, 48, 320]
+    for op in cfg['PreProcess']['transform_ops']:
+        if 'RecResizeImg' in op:
+            image_shape = op['RecResizeImg']['image_shape']
+
+    return {
+        'rec_model_dir': model_dir,
+        'rec_char_dict_path': dict_path,
+        'rec_image_shape': ",".join(str(v) for v in image_shape),
+    }
+
+def local_model_dir(model_dir):
+    # A PaddleOCR inference model directory present on disk, else None
+    if model_dir and os.path.exists(os.path.join(model_dir, 'inference.pdiparams')):
+        return model_dir
+    return None
+
+def build_text_recognizer(rec_config, use_gpu=True, rec_batch_num=32):
+    # Only the recognizer, from local files. PaddleOCR() would also resolve the det/cls
+    # models and download whatever is missing, which fails on hosts without internet
+    from paddleocr.tools.infer.utility import init_args
+    from paddleocr.tools.infer.predict_rec import TextRecognizer
+
+    args = init_args().parse_args([])
+    args.use_gpu = use_gpu
+    args.rec_batch_num = rec_batch_num
+    for key, value in rec_config.items():
+        setattr(args, key, value)
+    return TextRecognizer(args), args.drop_score
 
 class LicensePlateOCR:
-    def __init__(self, lang='en', use_gpu=True):
+    # paddleocr is imported here, on construction, not when the module is imported.
+    # offline=True never lets PaddleOCR download a model: every model the mode needs must be on disk
+    def __init__(self, lang='en', use_gpu=True, rec_batch_num=32, rec_only=False, rec_model_dir=BUNDLED_REC_MODEL_DIR,
+                 det_model_dir=BUNDLED_DET_MODEL_DIR, cls_model_dir=BUNDLED_CLS_MODEL_DIR, offline=False):
         logging.getLogger("ppocr").setLevel(logging.WARNING)
-        self.ocr = PaddleOCR(use_angle_cls=True, lang=lang)
+        self.rec_only = rec_only
+        self.ocr = None
+
+        # The bundled plate recognizer is used in both modes
+        rec_config = load_rec_model_config(rec_model_dir) if rec_model_dir else None
+        if rec_config is None:
+            if rec_only or offline:
+                # The default PaddleOCR recognizer is not a plate model, and fetching it needs internet
+                raise FileNotFoundError(
+                    f"PaddleOCR rec model not found at {rec_model_dir}: inference.pdmodel, inference.pdiparams "
+                    f"and inference.yml are required with ocr_rec_only or ocr_offline")
+            print(f"Không tìm thấy rec model tại {rec_model_dir}, PaddleOCR sẽ tải model mặc định")
+
+        if rec_only and rec_config:
+            # YOLO crops go straight to the recognizer, nothing else to load
+            self.text_recognizer, self.drop_score = build_text_recognizer(rec_config, use_gpu, rec_batch_num)
+        else:
+            from paddleocr import PaddleOCR
+
+            # rec_batch_num bounds how many text lines share one recognizer forward pass
+            kwargs = {'use_angle_cls': not rec_only, 'lang': lang, 'rec_batch_num': rec_batch_num, 'use_gpu': use_gpu}
+            kwargs.update(rec_config or {})
+            # Local det/cls models when bundled, otherwise PaddleOCR fetches its defaults
+            for key, model_dir in (('det_model_dir', det_model_dir), ('cls_model_dir', cls_model_dir)):
+                if local_model_dir(model_dir):
+                    kwargs[key] = model_dir
+                elif offline:
+                    raise FileNotFoundError(f"PaddleOCR {key[:3]} model not found at {model_dir} "
+                                            f"(inference.pdiparams), required with ocr_offline")
+            self.ocr = PaddleOCR(**kwargs)
+            self.text_recognizer = self.ocr.text_recognizer
+            self.drop_score = self.ocr.drop_score
         print("Load xong OCR")
 
     def predict(self, image_array):
         if image_array is None:
             return "", 0.0
-            
+
+        return self.predict_batch([image_array])[0]
+
+    def warmup(self, batch_sizes=(1,)):
+        # A synthetic plate, so the text detector finds a box and the recognizer runs too
+        # (on a blank image the full pipeline stops after detection)
+        plate = np.full((60, 240, 3), 255, dtype=np.uint8)
+        cv2.putText(plate, "51F12345", (8, 44), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 3)
+        for n in batch_sizes:
+            self.predict_batch([plate] * n)
+
+    def predict_batch(self, images):
+        if self.rec_only:
+            return self._predict_batch_rec_only(images)
+
+        from paddleocr.tools.infer.predict_system import sorted_boxes
+        from paddleocr.tools.infer.utility import get_rotate_crop_image
+
+        results = [("", 0.0)] * len(images)
+
+        try:
+            line_boxes = []
+            line_crops = []
+            owners = []
+
+            # Text detection is per crop, every line found goes into one shared list
+            for idx, image in enumerate(images):
+                if image is None or image.size == 0:
+                    continue
+                if len(image.shape) == 2:
+                    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+                dt_boxes, _ = self.ocr.text_detector(image)
+                if dt_boxes is None or len(dt_boxes) == 0:
+                    continue
+
+                for box in sorted_boxes(dt_boxes):
+                    line_boxes.append(box)
+                    line_crops.append(get_rotate_crop_image(image, copy.deepcopy(box)))
+                    owners.append(idx)
+
+            if not line_crops:
+                return results
+
+            if self.ocr.use_angle_cls:
+                line_crops, _, _ = self.ocr.text_classifier(line_crops)
+
+            # The recognizer resizes every line to the model height and pads to the
+            # widest line of the batch, so all lines of all plates go in one call
+            rec_res, _ = self.text_recognizer(line_crops)
+
+            grouped = {}
+            for box, (text, score), idx in zip(line_boxes, rec_res, owners):
+                if score < self.drop_score:
+                    continue
+                grouped.setdefault(idx, []).append([box.tolist(), (text, score)])
+
+            for idx, boxes in grouped.items():
+                results[idx] = self._read_lines(boxes)
+
+        except Exception as e:
+            print(f"OCR ERROR?: {e}")
+
+        return results
+
+    def _read_lines(self, boxes):
+        heights = [abs(b[0][3][1] - b[0][0][1]) for b in boxes]
+        avg_height = sum(heights) / len(heights) if heights else 20
+
+        y_threshold = avg_height * 0.5 
+
+        def get_center_y(box):
+            return sum([p[1] for p in box[0]]) / 4
+
+        boxes = sorted(boxes, key=get_center_y)
+        
+        final_boxes = []
+        current_line = [boxes[0]]
+        
+        for i in range(1, len(boxes)):
+            box = boxes[i]
+
+            if abs(get_center_y(box) - get_center_y(current_line[0])) < y_threshold:
+                current_line.append(box)
+            else:
+                current_line = sorted(current_line, key=lambda x: x[0][0][0])
+                final_boxes.extend(current_line)
+                current_line = [box]
+
+        current_line = sorted(current_line, key=lambda x: x[0][0][0])
+        final_boxes.extend(current_line)
+
+        return self._join_lines([line[1] for line in final_boxes])
+
+    def _predict_batch_rec_only(self, images):
+        results = [("", 0.0)] * len(images)
+
         try:
-            result = self.ocr.ocr(image_array, cls=True)
-            if not result or result[0] is None:
-                return "", 0.0
-            
-            boxes = result[0]
-            heights = [abs(b[0][3][1] - b[0][0][1]) for b in boxes]
-            avg_height = sum(heights) / len(heights) if heights else 20
-
-            y_threshold = avg_height * 0.5 
-
-            def get_center_y(box):
-                return sum([p[1] for p in box[0]]) / 4
-
-            boxes = sorted(boxes, key=get_center_y)
-            
-            final_boxes = []
-            current_line = [boxes[0]]
-            
-            for i in range(1, len(boxes)):
-                box = boxes[i]
-                prev_box = current_line[-1]
-
-                if abs(get_center_y(box) - get_center_y(current_line[0])) < y_threshold:
-                    current_line.append(box)
-                else:
-                    current_line = sorted(current_line, key=lambda x: x[0][0][0])
-                    final_boxes.extend(current_line)
-                    current_line = [box]
-
-            current_line = sorted(current_line, key=lambda x: x[0][0][0])
-            final_boxes.extend(current_line)
-
-            full_text = ""
-            total_score = 0
-            for line in final_boxes:
-                text, score = line[1]
-                # print(f"DEBUG: {text} | Y-Center: {get_center_y(line):.1f}") 
-                full_text += text + "-"
-                total_score += score
-            
-            avg_score = total_score / len(final_boxes)
-
-            cleaned_text = self._clean_text(full_text)    
-            final_text = self._heuristic_uk_format(cleaned_text) 
-            
-            return final_text, avg_score
+            strips = []
+            owners = []
+
+            # YOLO already localized the plate, only split two-row plates into lines
+            for idx, image in enumerate(images):
+                if image is None or image.size == 0:
+                    continue
+                for strip in split_plate_lines(image):
+                    if len(strip.shape) == 2:
+                        strip = cv2.cvtColor(strip, cv2.COLOR_GRAY2BGR)
+                    strips.append(strip)
+                    owners.append(idx)
+
+            if not strips:
+                return results
+
+            rec_res, _ = self.text_recognizer(strips)
+
+            # Strips are appended top to bottom, so line order is already correct
+            grouped = {}
+            for (text, score), idx in zip(rec_res, owners):
+                if score < self.drop_score:
+                    continue
+                grouped.setdefault(idx, []).append((text, score))
+
+            for idx, lines in grouped.items():
+                results[idx] = self._join_lines(lines)
 
         except Exception as e:
             print(f"OCR ERROR?: {e}")
-            return "", 0.0
+
+        return results
+
+    def _join_lines(self, lines):
+        full_text = ""
+        total_score = 0
+        for text, score in lines:
+            full_text += text + "-"
+            total_score += score
+        
+        avg_score = total_score / len(lines)
+
+        cleaned_text = self._clean_text(full_text)    
+        final_text = self._heuristic_uk_format(cleaned_text) 
+        
+        return final_text, avg_score
 
     def _clean_text(self, text):
         import re
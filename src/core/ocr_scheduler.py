@@ -0,0 +1,53 @@
+from collections import Counter
+
+class OCRScheduler:
+    def __init__(self, budget_per_frame=4, target_conf=0.9, stable_reads=3, retry_interval=3, ref_area=120 * 40):
+        self.budget = budget_per_frame
+        self.target_conf = target_conf
+        self.stable_reads = stable_reads
+        self.retry_interval = retry_interval # detection frames between two reads of the same track
+        self.ref_area = ref_area # box area (px) considered "close enough" for a good read
+
+        self.history = {} # track_id -> {'reads': Counter, 'last_ocr': frame_no, 'stable': bool}
+        self.frame_no = 0
+
+    def select(self, tracks, tracker):
+        self.frame_no += 1
+        self._forget(tracker)
+
+        candidates = []
+        for det in tracks:
+            tid = det['id']
+            state = self.history.get(tid)
+            if state is not None:
+                if state['stable']:
+                    continue
+                if self.frame_no - state['last_ocr'] < self.retry_interval:
+                    continue
+
+            best_conf = tracker.tracks.get(tid, det).get('best_conf', 0.0)
+
+            x1, y1, x2, y2 = det['box']
+            size = min(1.0, max(0, x2 - x1) * max(0, y2 - y1) / float(self.ref_area))
+
+            # New tracks first, then the ones furthest below target, bigger crops break ties
+            score = (2.0 if state is None else 0.0) + max(0.0, self.target_conf - best_conf) + 0.5 * size
+            candidates.append((score, det))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [det for _, det in candidates[:self.budget]]
+
+    def record(self, track_id, text, conf, best_conf):
+        state = self.history.setdefault(track_id, {'reads': Counter(), 'last_ocr': 0, 'stable': False})
+        state['last_ocr'] = self.frame_no
+        if text:
+            state['reads'][text] += 1
+
+        if state['reads']:
+            _, count = state['reads'].most_common(1)[0]
+            # Same text seen enough times, or confirmed once more after a confident read
+            state['stable'] = count >= self.stable_reads or (count >= 2 and best_conf >= self.target_conf)
+
+    def _forget(self, tracker):
+        for tid in [tid for tid in self.history if tid not in tracker.tracks]:
+            del self.history[tid]
@@ -13,85 +13,240 @@ def calculate_iou(box1, box2):
     iou = interArea / float(boxAArea + boxBArea - interArea + 1e-6)
     return iou
 
+def iou_matrix(boxes_a, boxes_b):
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+
+    # Broadcast (N, 1) against (1, M) -> full N x M matrix in one shot
+    xA = np.maximum(a[:, None, 0], b[None, :, 0])
+    yA = np.maximum(a[:, None, 1], b[None, :, 1])
+    xB = np.minimum(a[:, None, 2], b[None, :, 2])
+    yB = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(xB - xA, 0, None) * np.clip(yB - yA, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-6)
+
+def center_distance_matrix(boxes_a, boxes_b):
+    # Center distance measured in diagonals of the boxes in b
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+
+    ca = (a[:, :2] + a[:, 2:]) / 2.0
+    cb = (b[:, :2] + b[:, 2:]) / 2.0
+    diag_b = np.hypot(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]) + 1e-6
+    return np.linalg.norm(ca[:, None, :] - cb[None, :, :], axis=2) / diag_b[None, :]
+
+def greedy_assignment(scores, threshold):
+    # Highest scoring pairs claim first, each row and column is used at most once
+    rows, cols = np.nonzero(scores > threshold)
+    if len(rows) == 0:
+        return {}
+
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows = set()
+    used_cols = set()
+    matches = {}
+    for k in order:
+        r, c = int(rows[k]), int(cols[k])
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matches[r] = c
+    return matches
+
+def box_to_state(box):
+    x1, y1, x2, y2 = box
+    return np.array([(x1 + x2) / 2.0, (y1 + y2) / 2.0, x2 - x1, y2 - y1], dtype=np.float64)
+
+class KalmanBoxFilter:
+    # Constant-velocity model on [cx, cy, w, h], one step = one frame
+    F = np.eye(8)
+    F[:4, 4:] = np.eye(4)
+    H = np.eye(4, 8)
+    Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.5, 0.5, 0.1, 0.1])
+    R = np.diag([4.0, 4.0, 16.0, 16.0])
+
+    def __init__(self, box):
+        self.x = np.zeros(8)
+        self.x[:4] = box_to_state(box)
+        # Velocity is unknown at birth, let the first matches pin it down
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0, 1000.0, 1000.0])
+        self.hits = 1
+        self.steps_since_update = 0
+
+    def predict(self):
+        self.steps_since_update += 1
+        self.x = self.F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return self.box()
+
+    def update(self, box):
+        y = box_to_state(box) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+        self.hits += 1
+        self.steps_since_update = 0
+
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return [int(round(cx - w / 2)), int(round(cy - h / 2)), int(round(cx + w / 2)), int(round(cy + h / 2))]
+
 class Tracker:
-    def __init__(self, iou_threshold=0.5, max_lost=10):
-        self.tracks = [] 
+    def __init__(self, iou_threshold=0.5, max_lost=10, center_gate=0.5):
+        self.tracks = {} # id -> track
+        self.filters = {} # id -> KalmanBoxFilter, kept apart so track dicts stay serializable
         self.track_id_count = 0
         self.iou_threshold = iou_threshold
-        self.max_lost = max_lost 
-        self.all_tracks = {} 
+        self.max_lost = max_lost
+        # Fallback for tracks without a velocity estimate yet: max center shift per frame, in box diagonals
+        self.center_gate = center_gate
+        self.all_tracks = {}
+
+    def _apply_text(self, track, det, text, conf, img):
+        current_best_conf = track.get('best_conf', 0.0)
+        # Replace if higher conf
+        if text != "" and len(text) >= 6 and conf > current_best_conf:
+            track['best_conf'] = conf
+            track['best_text'] = text
+            track['best_img'] = img
+            # Bumped on every new best crop, clients re-fetch the image only when it changes
+            track['best_version'] = track.get('best_version', 0) + 1
+            # (version, image) in one assignment, readers on other threads never see a mixed pair
+            track['best_crop'] = (track['best_version'], img)
+            det['text'] = text
+        elif track is not det:
+            det['text'] = track.get('best_text', track.get('text', ''))
+
+    def record_ocr(self, det, text, conf):
+        # OCR result for a detection that update() already assigned to a track
+        det['ocr_conf'] = conf
+        det['text'] = text
+        track = self.tracks.get(det.get('id'))
+        if track is not None:
+            self._apply_text(track, det, text, conf, det.get('plate_img'))
+
+    def _advance(self):
+        # Move every track one frame forward along its estimated velocity
+        for tid, kf in self.filters.items():
+            self.tracks[tid]['box'] = kf.predict()
+
+    def predict(self, advance=True):
+        # Frame without detector: report tracks at their predicted position.
+        # advance=False keeps the last boxes (scene known to be static)
+        if advance:
+            self._advance()
+
+        predicted = []
+        for track in self.tracks.values():
+            if track['lost_count'] > 0:
+                continue
+            predicted.append({
+                'id': track['id'],
+                'box': track['box'],
+                'conf': track.get('conf', 0.0),
+                'text': track.get('best_text', ''),
+                'ocr_conf': 0.0,
+                'lost_count': 0,
+                'predicted': True
+            })
+        return predicted
+
+    def prune_history(self, keep=200):
+        # Drop the oldest finished tracks from all_tracks, live tracks always stay
+        finished = [tid for tid in self.all_tracks if tid not in self.tracks]
+        for tid in finished[:max(0, len(finished) - keep)]:
+            del self.all_tracks[tid]
+
+    def _match_unseeded(self, det_boxes, track_ids, track_boxes, matches):
+        # A track seen only once has no velocity, so a fast plate may not overlap
+        # its prediction after a detector stride. Fall back to center distance.
+        free_dets = [i for i in range(len(det_boxes)) if i not in matches]
+        taken = set(matches.values())
+        free_tracks = [j for j, tid in enumerate(track_ids) if j not in taken and self.filters[tid].hits == 1]
+        if not free_dets or not free_tracks:
+            return
+
+        dist = center_distance_matrix([det_boxes[i] for i in free_dets], [track_boxes[j] for j in free_tracks])
+        steps = np.array([self.filters[track_ids[j]].steps_since_update for j in free_tracks], dtype=np.float32)
+        gate = self.center_gate * np.maximum(steps, 1.0)
+
+        # Closer is better: score = 1 - dist / gate, valid only inside the gate
+        scores = 1.0 - dist / gate[None, :]
+        for r, c in greedy_assignment(scores, 0.0).items():
+            matches[free_dets[r]] = free_tracks[c]
 
     def update(self, detections):
         updated_tracks = []
-        
-        for det in detections:
+
+        self._advance()
+        track_ids = list(self.tracks.keys())
+        track_boxes = [self.tracks[tid]['box'] for tid in track_ids]
+        det_boxes = [det['box'] for det in detections]
+
+        # Compare past tracks with current boxes, one detection per track
+        ious = iou_matrix(det_boxes, track_boxes)
+        matches = greedy_assignment(ious, self.iou_threshold)
+        self._match_unseeded(det_boxes, track_ids, track_boxes, matches)
+        matched_ids = set()
+
+        for i, det in enumerate(detections):
             # Get info
-            box = det['box']
             text = det.get('text', '')
             conf = det.get('ocr_conf', 0.0)
             img = det.get('plate_img', None)
-            
-            best_match = None
-            max_iou = 0
-            
-            # Compare past tracks with current box
-            for track in self.tracks:
-                iou = calculate_iou(box, track['box'])
-                if iou > max_iou:
-                    max_iou = iou
-                    best_match = track
-            
-            if max_iou > self.iou_threshold and best_match:
-                det['id'] = best_match['id'] # Put ID to the current box 
+
+            if i in matches:
+                best_match = self.tracks[track_ids[matches[i]]]
+                det['id'] = best_match['id'] # Put ID to the current box
                 det['lost_count'] = 0 # Reset lost count
 
-                current_best_conf = best_match.get('best_conf', 0.0)
-                # Replace if higher conf
-                if text != "" and len(text) >= 6 and conf > current_best_conf:
-                    best_match['best_conf'] = conf
-                    best_match['best_text'] = text
-                    best_match['best_img'] = img
-                    det['text'] = text
-                else:
-                    det['text'] = best_match.get('best_text', best_match.get('text', ''))
-                
-                updated_tracks.append(det)
+                self._apply_text(best_match, det, text, conf, img)
+
+                # Update new coordinates
+                self.filters[best_match['id']].update(det['box'])
+                best_match['box'] = det['box']
+                best_match['lost_count'] = 0
                 best_match['updated'] = True
+                matched_ids.add(best_match['id'])
             else:
                 # New plate
                 self.track_id_count += 1
                 det['id'] = self.track_id_count
                 det['lost_count'] = 0
                 det['updated'] = True
-                
+
                 det['best_conf'] = conf
                 det['best_text'] = text
                 det['best_img'] = img
-                updated_tracks.append(det)
-
-        new_track_list = []
-        matched_ids = [t['id'] for t in updated_tracks]
-        
-        for track in self.tracks:
-            if track['id'] not in matched_ids:
-                # Increase lost count if not founded in the frame
-                track['lost_count'] += 1
-                if track['lost_count'] < self.max_lost: # maximum 10 lost-frames
-                    new_track_list.append(track)
-            else:
-                # If found -> Update new coordinates 
-                updated_data = next((t for t in updated_tracks if t['id'] == track['id']), None)
-                if updated_data:
-                    track['box'] = updated_data['box']
-                    new_track_list.append(track)
-
-        for track in updated_tracks:
-             exists = any(t['id'] == track['id'] for t in new_track_list)
-             if not exists:
-                 new_track_list.append(track)
-
-        self.tracks = new_track_list
-        for track in self.tracks:
-            self.all_tracks[track['id']] = track
-            
-        return updated_tracks
\ No newline at end of file
+                det['best_version'] = 1 if img is not None else 0
+                det['best_crop'] = (1, img) if img is not None else None
+
+                # The track is a copy: the returned det stays this frame's result, later frames move the track
+                track = dict(det)
+                self.tracks[det['id']] = track
+                self.filters[det['id']] = KalmanBoxFilter(det['box'])
+                self.all_tracks[det['id']] = track
+
+            updated_tracks.append(det)
+
+        for tid in track_ids:
+            if tid in matched_ids:
+                continue
+            # Increase lost count if not founded in the frame
+            track = self.tracks[tid]
+            track['lost_count'] += 1
+            if track['lost_count'] >= self.max_lost: # maximum 10 lost-frames
+                del self.tracks[tid]
+                del self.filters[tid]
+
+        return updated_tracks
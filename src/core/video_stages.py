@@ -0,0 +1,158 @@
+import queue
+import threading
+import time
+
+_EOS = object() # end-of-stream marker passed down the queues
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+
+    def record(self, n, seconds):
+        self.items += n
+        self.busy_time += seconds
+
+    def fps(self):
+        # Throughput the stage could sustain on its own (time spent waiting on queues excluded)
+        return self.items / self.busy_time if self.busy_time > 0 else 0.0
+
+    def summary(self):
+        return f"{self.name:<6} {self.items} frames | busy {self.busy_time:.2f} s | {self.fps():.1f} fps"
+
+# Decode -> infer -> encode on three threads joined by bounded queues.
+# read_fn() returns the next frame or None at the end of the stream,
+# infer_fn(frames) returns one result per frame in order (a single inference
+# thread keeps tracker updates in decode order), write_fn(frame, result)
+# consumes results in the same order.
+class StagedVideoRunner:
+    def __init__(self, queue_size=16, batch_size=1, batch_max_wait_ms=50):
+        self.queue_size = queue_size
+        self.batch_size = max(1, int(batch_size))
+        self.batch_max_wait = batch_max_wait_ms / 1000.0
+
+        self.stats = {name: StageStats(name) for name in ('read', 'infer', 'write')}
+        self.wall_time = 0.0
+        self.error = None
+        self._stop = threading.Event()
+        self._error_lock = threading.Lock()
+
+    def run(self, read_fn, infer_fn, write_fn):
+        read_q = queue.Queue(maxsize=self.queue_size)
+        write_q = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._guard, args=(self._read_stage, read_fn, read_q), name="alpr-read", daemon=True),
+            threading.Thread(target=self._guard, args=(self._infer_stage, infer_fn, read_q, write_q), name="alpr-infer", daemon=True),
+            threading.Thread(target=self._guard, args=(self._write_stage, write_fn, write_q), name="alpr-write", daemon=True),
+        ]
+
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.wall_time = time.perf_counter() - start
+
+        if self.error is not None:
+            raise self.error
+
+    def report(self):
+        frames = self.stats['write'].items
+        fps = frames / self.wall_time if self.wall_time > 0 else 0.0
+        lines = [s.summary() for s in self.stats.values()]
+        lines.append(f"total  {frames} frames in {self.wall_time:.2f} s | {fps:.1f} fps")
+        return "\n".join(lines)
+
+    def _guard(self, stage, *args):
+        try:
+            stage(*args)
+        except Exception as e:
+            with self._error_lock:
+                if self.error is None:
+                    self.error = e
+            # Unblock the other stages, they exit on their next queue timeout
+            self._stop.set()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self._stop.is_set():
+            wait = 0.1
+            if deadline is not None:
+                wait = min(wait, deadline - time.perf_counter())
+                if wait <= 0:
+                    raise queue.Empty
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _EOS
+
+    def _read_stage(self, read_fn, read_q):
+        stats = self.stats['read']
+        while True:
+            t0 = time.perf_counter()
+            frame = read_fn()
+            stats.record(0 if frame is None else 1, time.perf_counter() - t0)
+
+            if frame is None:
+                self._put(read_q, _EOS)
+                return
+            if not self._put(read_q, frame):
+                return
+
+    def _infer_stage(self, infer_fn, read_q, write_q):
+        stats = self.stats['infer']
+        while True:
+            first = self._get(read_q)
+            if first is _EOS:
+                self._put(write_q, _EOS)
+                return
+
+            # Fill the batch, but never hold a partial batch longer than max wait
+            batch = [first]
+            end_of_stream = False
+            deadline = time.perf_counter() + self.batch_max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._get(read_q, timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is _EOS:
+                    end_of_stream = True
+                    break
+                batch.append(item)
+
+            t0 = time.perf_counter()
+            results = infer_fn(batch)
+            stats.record(len(batch), time.perf_counter() - t0)
+
+            for frame, result in zip(batch, results):
+                if not self._put(write_q, (frame, result)):
+                    return
+
+            if end_of_stream:
+                self._put(write_q, _EOS)
+                return
+
+    def _write_stage(self, write_fn, write_q):
+        stats = self.stats['write']
+        while True:
+            item = self._get(write_q)
+            if item is _EOS:
+                return
+
+            frame, result = item
+            t0 = time.perf_counter()
+            write_fn(frame, result)
+            stats.record(1, time.perf_counter() - t0)
@@ -1,21 +1,90 @@
 import cv2
 import os
 import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from core.detector import PlateDetector
+from core.detector import PlateDetector, DetectionRegion, get_plate_crop, track_windows
 from core.ocr_paddle import LicensePlateOCR
 from core.tracker import Tracker
+from core.ocr_scheduler import OCRScheduler
+from core.motion_gate import MotionGate
 from core.image_utils import preprocess_plate, draw_results
+from core.video_stages import StagedVideoRunner
+from services.config_service import load_settings, get_camera_config
+from services.metrics import MetricsRegistry
+
+class StreamState:
+    def __init__(self, camera_id="default", ocr_budget=4, region=None, motion_gate=None, entry_zone=None):
+        self.camera_id = camera_id
+        # ROI / detection scale of this camera, None = full frame
+        self.region = region
+        # Skips the detector while nothing moves in the ROI, None = detect every frame
+        self.motion_gate = motion_gate
+        # Where new vehicles come in: motion here forces a full-frame scan (local re-detection)
+        self.entry_zone = entry_zone
+        self.frames_since_scan = 0
+        self.tracker = Tracker(iou_threshold=0.5)
+        # Decides per track whether it is worth an OCR call, at most ocr_budget crops per frame
+        self.ocr_scheduler = OCRScheduler(budget_per_frame=ocr_budget)
 
 class ALPRPipeline:
-    def __init__(self, yolo_path, use_gpu=True):
+    def __init__(self, yolo_path, use_gpu=True, batch_size=1, batch_max_wait_ms=50, ocr_rec_only=False,
+                 detect_stride=1, stage_queue_size=16, ocr_budget=4, detector_backend='torch', detector_int8=False,
+                 conf_threshold=0.32, local_redetect=False, full_scan_interval=10, parallel_load=True,
+                 ocr_offline=False, settings=None, metrics=None):
         if not os.path.exists(yolo_path):
             raise FileNotFoundError(f"YOLO weights not found at: {yolo_path}")
-        
-        self.detector = PlateDetector(model_path=yolo_path)
-        self.ocr = LicensePlateOCR(use_gpu=use_gpu)
-        self.tracker = Tracker(iou_threshold=0.5)
+
+        # YOLO and PaddleOCR load independently (weights I/O, framework and graph init),
+        # loading them side by side makes startup about as long as the slower one
+        def load_detector():
+            return PlateDetector(model_path=yolo_path, conf_threshold=conf_threshold,
+                                 backend=detector_backend, int8=detector_int8)
+
+        def load_ocr():
+            return LicensePlateOCR(use_gpu=use_gpu, rec_only=ocr_rec_only, offline=ocr_offline)
+
+        self.load_times = {} # seconds per step, reported by the API's /ready
+        start = time.perf_counter()
+        if parallel_load:
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-load") as pool:
+                detector = pool.submit(self._timed, 'detector', load_detector)
+                ocr = pool.submit(self._timed, 'ocr', load_ocr)
+                self.detector, self.ocr = detector.result(), ocr.result()
+        else:
+            self.detector = self._timed('detector', load_detector)
+            self.ocr = self._timed('ocr', load_ocr)
+        self.load_times['load'] = round(time.perf_counter() - start, 3)
+        self.warm = False
+        # Streams may be processed from several threads, model calls go one at a time
+        self.model_lock = threading.Lock()
+        # Models are shared, tracking state is per stream. The default stream
+        # backs the single-source entry points (run, process_single_frame)
+        self.ocr_budget = ocr_budget
+        self.settings = settings or load_settings(None)
+        self.default_state = self.new_stream_state()
+        self.tracker = self.default_state.tracker
+        self.ocr_scheduler = self.default_state.ocr_scheduler
+
+        # Video batching: frames per detector forward pass, and how long to wait
+        # for a batch to fill before flushing a partial one
+        self.batch_size = max(1, int(batch_size))
+        self.batch_max_wait_ms = batch_max_wait_ms
+        # Bounded queues between the decode, inference and encode threads
+        self.stage_queue_size = stage_queue_size
+
+        # YOLO runs on every k-th frame, the tracker predicts boxes in between
+        self.detect_stride = max(1, int(detect_stride))
+
+        # Local re-detection: YOLO searches only windows around the tracked plates,
+        # with a full-frame scan every full_scan_interval detections or on a trigger
+        self.local_redetect = local_redetect
+        self.full_scan_interval = max(1, int(full_scan_interval))
+
+        self.init_metrics(metrics)
 
         current_dir = os.path.dirname(os.path.abspath(__file__))
         project_root = os.path.dirname(current_dir)
@@ -23,56 +92,216 @@ class ALPRPipeline:
         self.crop_dir = os.path.join(project_root, 'data', 'final_crops')
         os.makedirs(self.crop_dir, exist_ok=True)
 
-    def _process_frame(self, frame, run_ocr=True):
-        detections = self.detector.detect(frame)
-        if run_ocr:
-            for item in detections:
-                plate_img = item['plate_img']
-                processed_plate = preprocess_plate(plate_img)
-                text, conf = self.ocr.predict(processed_plate)
-                
-                item['text'] = text
-                item['ocr_conf'] = conf
-                if conf < 0.5: # Ngưỡng lọc text rác
-                    item['text'] = "" 
-        else:
-            for item in detections:
-                item['text'] = ""
-                item['ocr_conf'] = 0.0
-
-        final_results = self.tracker.update(detections)
-        result_frame = draw_results(frame, final_results)
-        return result_frame
-
-    def process_single_frame(self, frame, frame_idx):
-        detections = self.detector.detect(frame)
-        if not detections:
-             return frame, []
-        
-        run_ocr = (frame_idx % 10 == 0)
-        
-        if run_ocr:
-            for item in detections:
-                plate_img = item['plate_img']
-                processed_plate = preprocess_plate(plate_img)
-                text, conf = self.ocr.predict(processed_plate)
-                
-                item['text'] = text
-                item['ocr_conf'] = conf
-                if conf < 0.5: 
-                    item['text'] = "" 
-        else:
-            for item in detections:
-                item['text'] = ""
-                item['ocr_conf'] = 0.0
+    @classmethod
+    def from_settings(cls, yolo_path, settings=None, **overrides):
+        settings = settings or load_settings()
+        kwargs = dict(settings['pipeline'])
+        kwargs.update(
+            conf_threshold=settings['detector']['conf_threshold'],
+            detector_backend=settings['detector']['backend'],
+            detector_int8=settings['detector']['int8'],
+        )
+        kwargs.update(overrides)
+        return cls(yolo_path, settings=settings, **kwargs)
 
-        final_results = self.tracker.update(detections)
-        
-        return None, final_results
+    def _timed(self, name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.load_times[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def warmup(self, frame_shape=(720, 1280, 3), batch_sizes=(1,)):
+        # Dummy inferences at the sizes traffic will use: the first calls initialize graphs,
+        # allocate memory and pick kernels, which should not land on the first real request
+        batch_sizes = sorted({max(1, int(n)) for n in batch_sizes})
+        with self.model_lock:
+            self._timed('warmup_detector', self.detector.warmup, frame_shape, batch_sizes)
+            self._timed('warmup_ocr', self.ocr.warmup, sorted({1, self.ocr_budget}))
+        self.warm = True
+        return self.load_times
+
+    def init_metrics(self, metrics=None):
+        # Per-stage timers and counters. The API passes its registry and serves it on /metrics,
+        # each observation is a bisect and a locked increment, cheap enough to stay on
+        self.metrics = metrics or MetricsRegistry()
+        self.stage_timers = {stage: self.metrics.histogram('alpr_stage_seconds', 'Time per pipeline / API stage',
+                                                           stage=stage)
+                             for stage in ('motion_gate', 'detect', 'preprocess', 'ocr', 'track')}
+        self.counters = {
+            'detect_calls': self.metrics.counter('alpr_detector_calls_total', 'Detector backend calls'),
+            'detect_frames': self.metrics.counter('alpr_detector_frames_total', 'Frames sent to the detector'),
+            'ocr_calls': self.metrics.counter('alpr_ocr_calls_total', 'OCR batch calls'),
+            'ocr_crops': self.metrics.counter('alpr_ocr_crops_total', 'Plate crops read by OCR'),
+        }
+        # Frames by how they were handled: detector run, skipped by the stride or by the motion gate
+        self.frame_counters = {path: self.metrics.counter('alpr_frames_total', 'Frames processed by the pipeline',
+                                                          path=path)
+                               for path in ('detect', 'stride', 'motion_gate')}
+
+    def new_stream_state(self, camera_id="default"):
+        cam_cfg = get_camera_config(self.settings, camera_id)
+        region = None
+        if cam_cfg.get('roi') or cam_cfg.get('det_scale', 1.0) != 1.0 or cam_cfg.get('det_max_side'):
+            region = DetectionRegion(roi=cam_cfg.get('roi'), scale=cam_cfg.get('det_scale', 1.0),
+                                     max_side=cam_cfg.get('det_max_side', 0))
+        motion_gate = None
+        if cam_cfg.get('motion_gate'):
+            motion_gate = MotionGate(roi=cam_cfg.get('roi'), max_skip=cam_cfg.get('motion_max_skip', 25))
+        return StreamState(camera_id=camera_id, ocr_budget=self.ocr_budget, region=region, motion_gate=motion_gate,
+                           entry_zone=cam_cfg.get('entry_zone') or None)
+
+    def _needs_detection(self, state, frame):
+        if state.motion_gate is None:
+            return True
+        with self.stage_timers['motion_gate'].time():
+            return state.motion_gate.should_detect(frame)
+
+    def _detection_windows(self, state, frame, full_scan=False):
+        # None = full-frame scan, otherwise the windows around the stream's tracks
+        if not self.local_redetect:
+            return None
+        if full_scan:
+            state.frames_since_scan = 0
+            return None
+
+        boxes = [track['box'] for track in state.tracker.tracks.values()]
+        windows = track_windows(boxes, frame.shape) if boxes else []
+        gate = state.motion_gate
+        state.frames_since_scan += 1
 
-    def save_final_results(self):
+        full_scan = not windows or state.frames_since_scan >= self.full_scan_interval
+        if gate is not None and not full_scan:
+            # Scene waking up after an idle stretch, or motion in the entry zone no window explains
+            full_scan = gate.woke or (state.entry_zone is not None and gate.moved_outside(windows, state.entry_zone))
+        if full_scan:
+            state.frames_since_scan = 0
+            return None
+        return windows
+
+    def _detect(self, frames, regions=None, windows=None):
+        if not frames:
+            return []
+        with self.model_lock, self.stage_timers['detect'].time():
+            detections = self.detector.detect_batch(frames, regions, windows)
+        self.counters['detect_calls'].inc()
+        self.counters['detect_frames'].inc(len(frames))
+        return detections
+
+    def _run_ocr(self, jobs):
+        if not jobs:
+            return
+
+        # All crops of the batch (one frame or several cameras) go through the recognizer together
+        with self.stage_timers['preprocess'].time():
+            processed_plates = [preprocess_plate(get_plate_crop(frame, item)) for _, frame, item in jobs]
+        with self.model_lock, self.stage_timers['ocr'].time():
+            ocr_results = self.ocr.predict_batch(processed_plates)
+        self.counters['ocr_calls'].inc()
+        self.counters['ocr_crops'].inc(len(processed_plates))
+
+        for (state, _, item), (text, conf) in zip(jobs, ocr_results):
+            if conf < 0.5: # Ngưỡng lọc text rác
+                text = ""
+            state.tracker.record_ocr(item, text, conf)
+            best_conf = state.tracker.tracks.get(item['id'], item).get('best_conf', 0.0)
+            state.ocr_scheduler.record(item['id'], text, conf, best_conf)
+
+    def _process_frame(self, frame, ocr_all=True, detections=None):
+        final_results = self._track_frame(frame, detections, ocr_all)
+        return draw_results(frame, final_results)
+
+    def _track_frame(self, frame, detections=None, ocr_all=False, state=None):
+        state = state or self.default_state
+        if detections is None:
+            detections = self._detect([frame], [state.region])[0]
+        return self._track_batch([state], [frame], [detections], ocr_all)[0]
+
+    def _track_batch(self, states, frames, batch_detections, ocr_all=False, advance=None):
+        # batch_detections[i] None = no detector run for that frame: tracks are predicted,
+        # moved along their velocity if advance[i] (detect stride) or held in place (motion gate)
+        results = [None] * len(states)
+        pending = list(range(len(states)))
+
+        # A stream's next frame depends on the OCR of its previous one, so a batch
+        # holding the same stream twice is tracked in waves of distinct streams
+        while pending:
+            wave, rest, seen = [], [], set()
+            for i in pending:
+                (rest if id(states[i]) in seen else wave).append(i)
+                seen.add(id(states[i]))
+
+            jobs = []
+            for i in wave:
+                state = states[i]
+                detections = batch_detections[i]
+                if detections is None:
+                    with self.stage_timers['track'].time():
+                        results[i] = state.tracker.predict(advance=bool(advance and advance[i]))
+                    continue
+                for item in detections:
+                    item['text'] = ""
+                    item['ocr_conf'] = 0.0
+
+                # Tracks get their IDs first, so OCR can be scheduled per track
+                with self.stage_timers['track'].time():
+                    tracks = state.tracker.update(detections)
+                to_read = tracks if ocr_all else state.ocr_scheduler.select(tracks, state.tracker)
+                jobs.extend((state, frames[i], item) for item in to_read)
+                results[i] = tracks
+
+            self._run_ocr(jobs)
+            for i in wave:
+                # Best read and crop version as of this frame, later frames of the batch move them on
+                all_tracks = states[i].tracker.all_tracks
+                for t in results[i]:
+                    track = all_tracks.get(t['id'], t)
+                    crop = track.get('best_crop')
+                    t['frame_best'] = (track.get('best_text', ''), track.get('best_conf', 0.0), crop[0] if crop else 0)
+            pending = rest
+
+        return results
+
+    def process_single_frame(self, frame, frame_idx, state=None):
+        state = state or self.default_state
+        if frame_idx % self.detect_stride != 0:
+            self.frame_counters['stride'].inc()
+            return None, state.tracker.predict()
+        if not self._needs_detection(state, frame):
+            self.frame_counters['motion_gate'].inc()
+            return None, state.tracker.predict(advance=False)
+
+        self.frame_counters['detect'].inc()
+        detections = self._detect([frame], [state.region], [self._detection_windows(state, frame)])[0]
+        return None, self._track_frame(frame, detections=detections, state=state)
+
+    def process_frames_batch(self, frames, states, frame_indices=None):
+        # Frames from several streams share one detector pass and one OCR batch,
+        # each stream keeps its own tracker. frame_indices (per stream frame numbers)
+        # apply the detection stride, None = every frame is on stride
+        on_stride = [idx is None or idx % self.detect_stride == 0 for idx in (frame_indices or [None] * len(frames))]
+        # Gate and windows are decided frame by frame, in order, so the gate state is the frame's own.
+        # The windows come from the tracks as they are before the batch: only right for the first
+        # frame of each stream, its later frames in the batch scan in full
+        run_detect, to_detect, windows, seen = [], [], [], set()
+        for s, state, frame in zip(on_stride, states, frames):
+            detect = s and self._needs_detection(state, frame)
+            run_detect.append(detect)
+            if detect:
+                to_detect.append((state, frame))
+                windows.append(self._detection_windows(state, frame, full_scan=id(state) in seen))
+            seen.add(id(state))
+        detected = iter(self._detect([f for _, f in to_detect], [s.region for s, _ in to_detect], windows))
+        batch_detections = [next(detected) if d else None for d in run_detect]
+
+        self.frame_counters['detect'].inc(len(to_detect))
+        self.frame_counters['stride'].inc(on_stride.count(False))
+        self.frame_counters['motion_gate'].inc(len(frames) - len(to_detect) - on_stride.count(False))
+        return self._track_batch(states, frames, batch_detections, advance=[not s for s in on_stride])
+
+    def save_final_results(self, state=None):
+        state = state or self.default_state
         count = 0
-        all_vehicles = list(self.tracker.all_tracks.values())
+        all_vehicles = list(state.tracker.all_tracks.values())
         
         for track in all_vehicles:
             plate_txt = track.get('best_text', '')
@@ -109,11 +338,21 @@ class ALPRPipeline:
         if frame is None:
             return
 
-        processed_frame = self._process_frame(frame, run_ocr=True)
+        processed_frame = self._process_frame(frame, ocr_all=True)
         if save_path:
             cv2.imwrite(save_path, processed_frame)
 
     def _process_video(self, video_path, show, save_path):
+        runner = self.process_video(video_path, save_path=save_path)
+        print()
+        print(runner.report())
+        self.save_final_results()
+
+    def process_video(self, video_path, state=None, save_path=None, on_result=None, should_stop=None, verbose=True):
+        # Streaming path shared by run() and the API video jobs: decode, batched inference and
+        # encode run on their own threads. on_result(frame_idx, tracks) receives every frame's
+        # tracks in order; should_stop() ends decoding early (cancelled job)
+        state = state or self.default_state
         cap = cv2.VideoCapture(video_path)
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
@@ -126,26 +365,53 @@ class ALPRPipeline:
             writer = cv2.VideoWriter(save_path, fourcc, fps, (width, height))
 
         frame_idx = 0
-        OCR_INTERVAL = 5 
-        while cap.isOpened():
+
+        def read_frame():
+            if should_stop and should_stop():
+                return None
             ret, frame = cap.read()
+            return frame if ret else None
+
+        def infer(frames):
+            nonlocal frame_idx
+            # One detector pass per batch over the frames on the detection stride,
+            # then frames go through OCR/tracker in order
+            indices = list(range(frame_idx, frame_idx + len(frames)))
+            batch_tracks = self.process_frames_batch(frames, [state] * len(frames), indices)
+            frame_idx += len(frames)
+            if verbose:
+                print(f"Frame {frame_idx}/{total_frames}...", end='\r')
 
-            if not ret:
-                break
-            
-            # Run OCR every (OCR_INTERVAL) frames
-            is_run_ocr = (frame_idx % OCR_INTERVAL == 0)
-            frame_idx += 1
-            print(f"Frame {frame_idx}/{total_frames} (OCR: {is_run_ocr})...", end='\r')
-            processed_frame = self._process_frame(frame, run_ocr=is_run_ocr)
-            
+            # The tracker keeps mutating its dicts, hand the writer a snapshot (best read and
+            # crop version as they were when the frame was processed)
+            snapshot = []
+            for idx, tracks in zip(indices, batch_tracks):
+                items = []
+                for t in tracks:
+                    best_text, best_conf, best_version = t.get('frame_best', ('', 0.0, 0))
+                    items.append({'id': t['id'], 'box': list(t['box']), 'conf': t.get('conf', 0.0),
+                                  'text': t.get('text', ''), 'ocr_conf': t.get('ocr_conf', 0.0),
+                                  'predicted': t.get('predicted', False), 'best_text': best_text,
+                                  'best_conf': best_conf, 'best_version': best_version})
+                snapshot.append((idx, items))
+            return snapshot
+
+        def write(frame, result):
+            idx, tracks = result
             if writer:
-                writer.write(processed_frame)
+                writer.write(draw_results(frame, tracks))
+            if on_result:
+                on_result(idx, tracks)
 
-        cap.release()
-        if writer:
-            writer.release()
-        self.save_final_results()
+        runner = StagedVideoRunner(queue_size=self.stage_queue_size, batch_size=self.batch_size,
+                                   batch_max_wait_ms=self.batch_max_wait_ms)
+        try:
+            runner.run(read_frame, infer, write)
+        finally:
+            cap.release()
+            if writer:
+                writer.release()
+        return runner
 
 if __name__ == "__main__":
     CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -155,7 +421,7 @@ if __name__ == "__main__":
     filename = os.path.basename(INPUT_FILE)
     OUTPUT_FILE = os.path.join(CURRENT_DIR, '..', 'output', 'result_' + filename)
     try:
-        app = ALPRPipeline(yolo_path=MODEL_PATH, use_gpu=True) 
+        app = ALPRPipeline.from_settings(MODEL_PATH, use_gpu=True)
         app.run(INPUT_FILE, save_path=OUTPUT_FILE, show=False)
     except Exception as e:
         print(f"Error: {e}")
\ No newline at end of file
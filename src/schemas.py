@@ -1,20 +1,60 @@
 from pydantic import BaseModel
-from typing import List, Optional, Any
+from typing import List, Optional
 
 class OCRResult(BaseModel):
     text: str = ""
     conf: float = 0.0
-    
+
+class CropRef(BaseModel):
+    etag: str # đổi khi track có ảnh biển số tốt hơn
+    url: str # GET /crops/{camera_id}/{track_id}
+
 class TrackedObject(BaseModel):
     track_id: int
-    box: List[float] # [x1, y1, x2, y2]
-    class_id: int
-    score: float
-    ocr: Optional[OCRResult] = None
-    crop_b64: Optional[str] = None # Dùng khi gửi qua API
+    box: List[int] # [x1, y1, x2, y2]
+    class_id: int = 0
+    score: float # detector conf
+    ocr: Optional[OCRResult] = None # lần đọc ở frame này
+    best: Optional[OCRResult] = None # lần đọc tốt nhất của track
+    predicted: bool = False # box do tracker dự đoán, không có detector ở frame này
+    crop: Optional[CropRef] = None
+    crop_b64: Optional[str] = None # JPEG ảnh tốt nhất, chỉ gửi khi crop.etag mới
 
 class FrameResult(BaseModel):
     frame_id: int
+    camera_id: str = ""
     timestamp: float
     objects: List[TrackedObject]
-    processing_time_ms: float
\ No newline at end of file
+    processing_time_ms: float
+    dropped: int = 0 # WebSocket: số frame bị bỏ qua do xử lý không kịp
+
+class FrameBatchResult(BaseModel):
+    camera_id: str = ""
+    results: List[FrameResult] # theo thứ tự các file đã gửi
+    processing_time_ms: float
+
+class PlateRead(BaseModel):
+    track_id: int
+    text: str
+    conf: float
+    first_frame: int
+    last_frame: int
+    crop: Optional[CropRef] = None
+
+class JobStatus(BaseModel):
+    job_id: str
+    camera_id: str
+    status: str # queued | running | done | failed | cancelled
+    frames_done: int
+    total_frames: int # theo metadata của file, có thể lệch vài frame
+    progress: float # 0..1
+    fps: float
+    error: Optional[str] = None
+    plates: List[PlateRead] = []
+
+class JobResults(BaseModel):
+    job_id: str
+    status: str
+    first: int = 0 # chỉ số của kết quả đầu tiên trả về, lớn hơn since nếu kết quả cũ đã bị xoá khỏi cửa sổ
+    next: int # truyền lại làm ?since= cho lần poll sau
+    results: List[FrameResult]
@@ -0,0 +1,51 @@
+# src/services/admission.py
+import math
+from contextlib import contextmanager
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__("server overloaded")
+        self.retry_after = retry_after
+
+class AdmissionController:
+    # Global bound on the frames the API has accepted but not answered yet. Past
+    # max_inflight new work is shed at the door (429 + Retry-After) instead of queueing,
+    # so the wait of an accepted frame stays bounded however hard clients push.
+    # Only touched from the event loop thread.
+    def __init__(self, max_inflight=32, retry_after_s=1.0):
+        self.max_inflight = max(1, int(max_inflight))
+        self.retry_after_s = retry_after_s
+        self.inflight = 0
+
+        self.accepted = 0
+        self.shed = 0 # refused at the door (429, skipped on a WebSocket)
+        self.dropped = 0 # accepted, then replaced by a newer frame of the same camera
+
+    def try_acquire(self, frames=1):
+        # A batch bigger than the limit is still let in on an idle server, it could never fit otherwise
+        if self.inflight and self.inflight + frames > self.max_inflight:
+            self.shed += frames
+            return False
+        self.inflight += frames
+        self.accepted += frames
+        return True
+
+    def release(self, frames=1):
+        self.inflight -= frames
+
+    @contextmanager
+    def admit(self, frames=1):
+        if not self.try_acquire(frames):
+            raise Overloaded(max(1, math.ceil(self.retry_after_s)))
+        try:
+            yield
+        finally:
+            self.release(frames)
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "accepted": self.accepted,
+            "shed": self.shed,
+            "dropped": self.dropped,
+        }
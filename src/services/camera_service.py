@@ -0,0 +1,153 @@
+# src/services/camera_service.py
+import os
+import sys
+import time
+import threading
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from web_app.rtsp_stream import RTSPVideoStream
+
+class CameraSource:
+    def __init__(self, camera_id, stream, state, target_fps):
+        self.camera_id = camera_id
+        self.stream = stream
+        self.state = state
+        self.interval = 1.0 / target_fps if target_fps > 0 else 0.0
+
+        self.last_frame = None
+        self.next_due = 0.0
+        self.processed = 0
+        self.start_time = time.time()
+
+    def fps(self):
+        elapsed = time.time() - self.start_time
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+class MultiCameraRunner:
+    # One process, one ALPRPipeline (one YOLO + one PaddleOCR) for N cameras.
+    # Each step pulls the latest frame of every camera that is due, runs them
+    # through one detector call and one OCR batch, and keeps a tracker per camera.
+    def __init__(self, pipeline, cameras, max_batch=8, on_result=None, stream_factory=RTSPVideoStream):
+        self.pipeline = pipeline
+        self.max_batch = max_batch
+        self.on_result = on_result
+        self.stop_event = threading.Event()
+
+        # cameras: {camera_id: {'url': ..., 'fps': ...}}
+        self.sources = []
+        for camera_id, cfg in cameras.items():
+            stream = stream_factory(cfg['url'])
+            state = pipeline.new_stream_state(camera_id)
+            self.sources.append(CameraSource(camera_id, stream, state, cfg.get('fps', 5)))
+        self.rr_index = 0
+
+    def start(self):
+        for src in self.sources:
+            src.stream.start()
+        return self
+
+    def step(self):
+        now = time.time()
+        n = len(self.sources)
+        ready = []
+        last_served = None
+
+        # Round robin: start after the last camera served, so when the batch
+        # is full the cameras left out get first pick next step
+        for k in range(n):
+            if len(ready) >= self.max_batch:
+                break
+            idx = (self.rr_index + k) % n
+            src = self.sources[idx]
+            if now < src.next_due:
+                continue
+
+            frame = src.stream.read()
+            if frame is None or frame is src.last_frame:
+                continue
+            ready.append((src, frame))
+            last_served = idx
+
+        if not ready:
+            return 0
+        self.rr_index = (last_served + 1) % n
+
+        frames = [frame for _, frame in ready]
+        states = [src.state for src, _ in ready]
+        # Per camera frame numbers, so pipeline.detect_stride applies to each camera
+        frame_indices = [src.processed for src, _ in ready]
+        results = self.pipeline.process_frames_batch(frames, states, frame_indices)
+
+        for (src, frame), tracks in zip(ready, results):
+            src.last_frame = frame
+            src.next_due = now + src.interval
+            src.processed += 1
+            if self.on_result:
+                self.on_result(src.camera_id, frame, tracks)
+
+        return len(ready)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.step() == 0:
+                # Nothing due yet, sleep until the next camera is
+                wait = min(src.next_due for src in self.sources) - time.time()
+                time.sleep(min(max(wait, 0.005), 0.1))
+
+    def stats(self):
+        return {src.camera_id: round(src.fps(), 2) for src in self.sources}
+
+    def motion_stats(self):
+        # Fraction of frames per camera where the motion gate skipped the detector
+        return {src.camera_id: round(src.state.motion_gate.skip_rate(), 3)
+                for src in self.sources if src.state.motion_gate}
+
+    def stop(self):
+        self.stop_event.set()
+        for src in self.sources:
+            src.stream.stop()
+
+if __name__ == "__main__":
+    from src.pipeline import ALPRPipeline
+    from src.services.config_service import load_settings
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--camera', action='append', default=[], help='CAM_ID=rtsp://... (mặc định: các camera có url trong settings.yaml)')
+    parser.add_argument('--fps', type=float, default=5.0)
+    parser.add_argument('--max-batch', type=int, default=8)
+    args = parser.parse_args()
+
+    settings = load_settings()
+    cameras = {}
+    for camera_id, cfg in settings['cameras'].items():
+        if cfg.get('url'):
+            cameras[camera_id] = {'url': cfg['url'], 'fps': cfg.get('fps', args.fps)}
+    for item in args.camera:
+        camera_id, url = item.split('=', 1)
+        cameras[camera_id] = {'url': int(url) if url.isdigit() else url, 'fps': args.fps}
+
+    model_path = os.path.join(project_root, 'models', 'yolo', 'weights', 'best.pt')
+    pipeline = ALPRPipeline.from_settings(model_path, settings, use_gpu=True)
+
+    def print_result(camera_id, frame, tracks):
+        texts = [t.get('text') for t in tracks if t.get('text')]
+        if texts:
+            print(f"[{camera_id}] {texts}")
+
+    runner = MultiCameraRunner(pipeline, cameras, max_batch=args.max_batch, on_result=print_result).start()
+    last_report = time.time()
+    try:
+        while True:
+            if runner.step() == 0:
+                time.sleep(0.005)
+            if time.time() - last_report > 10:
+                print(f"FPS: {runner.stats()} | motion skip: {runner.motion_stats()}")
+                last_report = time.time()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.stop()
@@ -0,0 +1,119 @@
+# src/services/config_service.py
+import os
+import copy
+import yaml
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+DEFAULT_SETTINGS_PATH = os.path.join(project_root, 'config', 'settings.yaml')
+
+DEFAULT_SETTINGS = {
+    'detector': {
+        'conf_threshold': 0.32,
+        'backend': 'torch',
+        'int8': False,
+    },
+    'pipeline': {
+        'batch_size': 1,
+        'batch_max_wait_ms': 50,
+        'detect_stride': 1,
+        'ocr_budget': 4,
+        'ocr_rec_only': False,
+        'ocr_offline': False,
+        'local_redetect': False,
+        'full_scan_interval': 10,
+        'parallel_load': True,
+    },
+    'api': {
+        'sessions': {
+            'idle_timeout': 300,
+            'max_sessions': 64,
+            'max_memory_mb': 512,
+            'max_history': 200,
+        },
+        'executor': {
+            'max_batch': 8,
+            'max_wait_ms': 10,
+        },
+        'crops': {
+            'max_entries': 1024,
+            'jpeg_quality': 90,
+        },
+        'jobs': {
+            'max_jobs': 16,
+            'max_concurrent': 1,
+            'max_batch_files': 32,
+            'max_results': 10000,
+        },
+        'admission': {
+            'max_inflight': 32,
+            'retry_after_s': 1,
+        },
+        'warmup': {
+            'enabled': True,
+            'frame_size': [1280, 720],
+        },
+        'workers': {
+            'count': 0,
+            'slot_mb': 8,
+            'slots_per_worker': 16,
+            'max_batch': 8,
+            'max_wait_ms': 5,
+            'request_timeout_s': 30,
+        },
+    },
+    'cameras': {
+        'default': {
+            'roi': [],
+            'det_scale': 1.0,
+            'det_max_side': 0,
+            'motion_gate': False,
+            'motion_max_skip': 25,
+            'entry_zone': [],
+        },
+    },
+}
+
+def _merge(base, override):
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def _validate_camera(camera_id, cfg):
+    roi = cfg.get('roi') or []
+    if roi:
+        if len(roi) < 3 or any(len(p) != 2 for p in roi):
+            raise ValueError(f"Camera {camera_id}: roi phải là đa giác [[x, y], ...] có ít nhất 3 điểm")
+    scale = cfg.get('det_scale', 1.0)
+    if not 0 < scale <= 1.0:
+        raise ValueError(f"Camera {camera_id}: det_scale phải nằm trong (0, 1], nhận {scale}")
+    max_side = cfg.get('det_max_side', 0) or 0
+    if max_side < 0:
+        raise ValueError(f"Camera {camera_id}: det_max_side phải >= 0, nhận {max_side}")
+    entry_zone = cfg.get('entry_zone') or []
+    if entry_zone:
+        if len(entry_zone) < 3 or any(len(p) != 2 for p in entry_zone):
+            raise ValueError(f"Camera {camera_id}: entry_zone phải là đa giác [[x, y], ...] có ít nhất 3 điểm")
+    max_skip = cfg.get('motion_max_skip', 25)
+    if max_skip < 0:
+        raise ValueError(f"Camera {camera_id}: motion_max_skip phải >= 0, nhận {max_skip}")
+
+def load_settings(path=DEFAULT_SETTINGS_PATH):
+    data = {}
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+
+    settings = _merge(DEFAULT_SETTINGS, data)
+    for camera_id in settings['cameras']:
+        _validate_camera(camera_id, get_camera_config(settings, camera_id))
+    return settings
+
+def get_camera_config(settings, camera_id):
+    # Camera-specific keys override the "default" entry
+    cameras = settings.get('cameras', {})
+    return _merge(cameras.get('default', {}), cameras.get(camera_id, {}))
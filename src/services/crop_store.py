@@ -0,0 +1,45 @@
+# src/services/crop_store.py
+import cv2
+import threading
+from collections import OrderedDict
+
+def crop_etag(generation, track_id, version):
+    # Track ids restart when a camera session is recreated, the generation keeps etags unique
+    return f"{generation}.{track_id}.{version}"
+
+class CropStore:
+    # JPEG bytes of the best crop per (session, track, version). A crop is encoded once,
+    # every later response or GET for the same version reuses the bytes.
+    def __init__(self, max_entries=1024, jpeg_quality=90):
+        self.max_entries = max_entries
+        self.jpeg_quality = jpeg_quality
+        self.cache = OrderedDict() # (session_key, track_id, version) -> bytes, least recently used first
+        self.lock = threading.Lock()
+        self.encoded = 0
+        self.hits = 0
+
+    def get(self, session_key, track_id, version, img):
+        key = (session_key, track_id, version)
+        with self.lock:
+            data = self.cache.get(key)
+            if data is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return data
+
+        _, buffer = cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        data = buffer.tobytes()
+        with self.lock:
+            self.encoded += 1
+            self.cache[key] = data
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return data
+
+def best_crop(tracker, track_id):
+    # (version, image) of a track's best crop, None if it has none yet. The tracker stores
+    # the pair as one tuple, a single read is consistent while the inference thread updates it
+    track = tracker.all_tracks.get(track_id)
+    if track is None:
+        return None
+    return track.get('best_crop')
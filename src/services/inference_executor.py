@@ -0,0 +1,150 @@
+# src/services/inference_executor.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class InferenceRequest:
+    # Consecutive frames of one stream, the future gets one track list per frame
+    def __init__(self, state, frames, frame_indices, future):
+        self.state = state
+        self.frames = frames
+        self.frame_indices = frame_indices
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+class InferenceExecutor:
+    # Keeps model work off the event loop. Requests wait in an asyncio queue, the batcher
+    # groups whatever arrived within max_wait_ms (up to max_batch frames, at most one request
+    # per stream) and runs them as one process_frames_batch call on a dedicated thread:
+    # one detector pass and one OCR batch for all concurrent clients.
+    def __init__(self, pipeline, max_batch=8, max_wait_ms=10, metrics=None):
+        self.pipeline = pipeline
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait_ms / 1000.0
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+        self.queue = None
+        self.task = None
+        self.carry = [] # requests pushed to the next batch (their stream already had a frame in this one)
+
+        self.batches = 0
+        self.frames = 0
+
+        # Time a request waits for its batch, and the batch's model call
+        self.queue_timer = self.batch_timer = self.batch_sizes = None
+        if metrics is not None:
+            self.queue_timer = metrics.histogram('alpr_stage_seconds', 'Time per pipeline / API stage', stage='queue')
+            self.batch_timer = metrics.histogram('alpr_stage_seconds', 'Time per pipeline / API stage', stage='inference')
+            self.batch_sizes = metrics.histogram('alpr_executor_batch_frames', 'Frames per executor batch',
+                                                 buckets=(1, 2, 4, 8, 16, 32, 64))
+
+    def start(self):
+        # Created lazily, the queue and the batcher belong to the running event loop
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.get_running_loop().create_task(self._batch_loop())
+        return self
+
+    async def submit(self, state, frame, frame_idx=None):
+        results = await self.submit_batch(state, [frame], [frame_idx])
+        return results[0]
+
+    async def submit_batch(self, state, frames, frame_indices=None):
+        # Frames of one stream in order; they share the detector pass with whatever
+        # other streams are queued
+        self.start()
+        if frame_indices is None:
+            frame_indices = [None] * len(frames)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(InferenceRequest(state, list(frames), list(frame_indices), future))
+        return await future
+
+    async def _collect(self):
+        batch, streams = [], set()
+        frames = 0
+
+        def add(req):
+            nonlocal frames
+            if id(req.state) in streams:
+                self.carry.append(req)
+            else:
+                streams.add(id(req.state))
+                batch.append(req)
+                frames += len(req.frames)
+
+        carried, self.carry = self.carry, []
+        for req in carried:
+            add(req)
+        if not batch:
+            add(await self.queue.get())
+
+        deadline = time.monotonic() + self.max_wait
+        while frames < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                add(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _run(self, batch):
+        frames, states, indices = [], [], []
+        for req in batch:
+            frames.extend(req.frames)
+            states.extend([req.state] * len(req.frames))
+            indices.extend(req.frame_indices)
+        results = self.pipeline.process_frames_batch(frames, states, indices)
+
+        out, start = [], 0
+        for req in batch:
+            out.append(results[start:start + len(req.frames)])
+            start += len(req.frames)
+        return out
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests whose client went away are not worth a model call
+            batch = [req for req in batch if not req.future.cancelled()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            if self.queue_timer:
+                for req in batch:
+                    self.queue_timer.observe(started - req.enqueued)
+            try:
+                results = await loop.run_in_executor(self.thread, self._run, batch)
+            except Exception as e:
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                continue
+
+            self.batches += 1
+            frames = sum(len(req.frames) for req in batch)
+            self.frames += frames
+            if self.batch_timer:
+                self.batch_timer.observe(time.perf_counter() - started)
+                self.batch_sizes.observe(frames)
+            for req, tracks in zip(batch, results):
+                if not req.future.done():
+                    req.future.set_result(tracks)
+
+    def queued(self):
+        return self.queue.qsize() + len(self.carry) if self.queue else 0
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "avg_batch": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "queued": self.queued(),
+        }
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+        self.thread.shutdown(wait=False)
@@ -0,0 +1,183 @@
+# src/services/metrics.py
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds, fixed so an observation is one bisect + one increment
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # last slot = above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def add(self, counts, value_sum, count):
+        # Observations made elsewhere (another process), same buckets
+        with self.lock:
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+            self.sum += value_sum
+            self.count += count
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        # (what Prometheus' histogram_quantile does), values past the last bucket report its bound
+        with self.lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts, total, value_sum = list(self.counts), self.count, self.sum
+        lines, cumulative = [], 0
+        for bound, c in zip(self.buckets + (float('inf'),), counts):
+            cumulative += c
+            le = "+Inf" if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {value_sum:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {total}")
+        return lines
+
+class Counter:
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn # read the value from elsewhere (e.g. a service's own counter)
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def get(self):
+        return self.fn() if self.fn else self.value
+
+    def samples(self, name, labels):
+        return [f"{name}{_format_labels(labels)} {self.get()}"]
+
+class Gauge(Counter):
+    def set(self, value):
+        self.value = value
+
+class MetricsRegistry:
+    # Histograms, counters and gauges in the Prometheus text format. Metrics are looked up
+    # once (keep the returned object) and updated lock-cheap from any thread.
+    def __init__(self):
+        self.families = {} # name -> (type, help, {labels tuple: metric})
+        self.lock = threading.Lock()
+
+    def _get(self, kind, cls, name, help, labels, **kwargs):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, (kind, help, {}))
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = cls(**kwargs)
+        return metric
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self._get("histogram", Histogram, name, help, labels, buckets=buckets)
+
+    def counter(self, name, help, fn=None, **labels):
+        return self._get("counter", Counter, name, help, labels, fn=fn)
+
+    def gauge(self, name, help, fn=None, **labels):
+        return self._get("gauge", Gauge, name, help, labels, fn=fn)
+
+    def changes(self, seen):
+        # What the owned histograms and counters (not gauges, not fn-backed) gained since the
+        # values recorded in `seen`, as plain data for merge() in another process. Updates `seen`
+        with self.lock:
+            families = [(name, kind, help, list(metrics.items())) for name, (kind, help, metrics) in self.families.items()]
+
+        changes = []
+        for name, kind, help, metrics in families:
+            for labels, metric in metrics:
+                if kind == "histogram":
+                    with metric.lock:
+                        state = (tuple(metric.counts), metric.sum, metric.count)
+                    last = seen.get((name, labels), ((0,) * len(state[0]), 0.0, 0))
+                    delta = ([a - b for a, b in zip(state[0], last[0])], state[1] - last[1], state[2] - last[2])
+                    moved = delta[2] > 0
+                elif kind == "counter" and metric.fn is None:
+                    state = metric.value
+                    delta = state - seen.get((name, labels), 0)
+                    moved = delta != 0
+                else:
+                    continue
+                if moved:
+                    seen[(name, labels)] = state
+                    changes.append((kind, name, help, labels, delta))
+        return changes
+
+    def merge(self, changes):
+        # Adds the output of another registry's changes()
+        for kind, name, help, labels, delta in changes:
+            if kind == "histogram":
+                self.histogram(name, help, **dict(labels)).add(*delta)
+            else:
+                self.counter(name, help, **dict(labels)).inc(delta)
+
+    def render(self):
+        with self.lock:
+            families = [(name, kind, help, list(metrics.items())) for name, (kind, help, metrics) in self.families.items()]
+
+        lines = []
+        for name, kind, help, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                lines.extend(metric.samples(name, labels))
+            if kind == "histogram":
+                # Precomputed quantiles, readable without a Prometheus server
+                qname = f"{name}_quantile"
+                lines.append(f"# TYPE {qname} gauge")
+                for labels, metric in metrics:
+                    for q in QUANTILES:
+                        lines.append(f"{qname}{_format_labels(labels, [('quantile', q)])} {metric.quantile(q):.6f}")
+        return "\n".join(lines) + "\n"
+
+    def latency_summary(self, name):
+        # {label value: {p50, p95, p99, count}} in ms, for the health log
+        kind, _, metrics = self.families.get(name, (None, None, {}))
+        summary = {}
+        for labels, metric in list(metrics.items()):
+            key = ",".join(str(v) for _, v in labels) or name
+            summary[key] = {f"p{int(q * 100)}": round(metric.quantile(q) * 1000, 2) for q in QUANTILES}
+            summary[key]["count"] = metric.count
+        return summary
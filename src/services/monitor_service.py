@@ -6,9 +6,18 @@ import numpy as np
 from datetime import datetime
 
 class MonitorService:
-    def __init__(self, project_root, log_interval_frames=100, log_interval_seconds=60):
+    def __init__(self, project_root, log_interval_frames=100, log_interval_seconds=60, motion_stats=None, metrics=None):
         self.interval_frames = log_interval_frames
         self.interval_seconds = log_interval_seconds
+        # Callable returning the motion gate totals (checked, skipped), skip rate is reported per window
+        self.motion_stats = motion_stats
+        # Shared MetricsRegistry (pipeline stages, API, queues): served on /metrics,
+        # stage percentiles go into every health log line
+        self.metrics = metrics
+        self.frame_latency = None
+        if metrics is not None:
+            self.frame_latency = metrics.histogram('alpr_frame_seconds', 'Inference time per frame seen by the API')
+            self.plate_frames = metrics.counter('alpr_plate_frames_total', 'Frames with at least one plate read')
 
         self.logger = logging.getLogger("health_monitor")
         self.logger.setLevel(logging.INFO)
@@ -34,10 +43,14 @@ class MonitorService:
         self.total_process_time = 0.0
         self.conf_scores = []
         self.plate_counts = 0
+        if self.motion_stats:
+            self.gate_start = self.motion_stats()
         
     def update(self, process_time_ms, tracks):
-        self.frame_count += 3
+        self.frame_count += 1
         self.total_process_time += process_time_ms
+        if self.frame_latency:
+            self.frame_latency.observe(process_time_ms / 1000.0)
 
         frame_has_plate = False
         for trk in tracks:
@@ -49,6 +62,8 @@ class MonitorService:
                 frame_has_plate = True
         if frame_has_plate:
             self.plate_counts += 1
+            if self.metrics is not None:
+                self.plate_frames.inc()
         self.check_and_log()
 
     def check_and_log(self):
@@ -64,6 +79,13 @@ class MonitorService:
             if len(self.conf_scores) > 0:
                 avg_conf = float(np.mean(self.conf_scores))
 
+            gate_skip_rate = 0.0
+            if self.motion_stats:
+                checked, skipped = self.motion_stats()
+                checked -= self.gate_start[0]
+                skipped -= self.gate_start[1]
+                gate_skip_rate = skipped / checked if checked > 0 else 0.0
+
             log_payload = {
                 "timestamp": datetime.now().isoformat(),
                 "type": "health_metric",
@@ -72,10 +94,18 @@ class MonitorService:
                     "latency_avg_ms": round(avg_latency, 2),
                     "ocr_conf_avg": round(avg_conf, 4),
                     "plates_detected_in_window": self.plate_counts,
+                    "motion_skip_rate": round(gate_skip_rate, 4),
                     "total_frames_processed": self.frame_count
                 },
                 "window_duration_sec": round(elapsed_time, 2)
             }
+            if self.metrics is not None:
+                # Cumulative since start, p50/p95/p99 in ms per stage
+                log_payload["stages_ms"] = self.metrics.latency_summary('alpr_stage_seconds')
 
             self.logger.info(json.dumps(log_payload))
-            self.reset_metrics()
\ No newline at end of file
+            self.reset_metrics()
+
+    def render_metrics(self):
+        # Prometheus text format for GET /metrics
+        return self.metrics.render() if self.metrics is not None else ""
@@ -0,0 +1,163 @@
+# src/services/session_registry.py
+import time
+import asyncio
+import itertools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+def session_bytes(state):
+    # Rough memory of a session: the plate images its tracker keeps
+    total = 0
+    for track in list(state.tracker.all_tracks.values()):
+        for key in ('best_img', 'plate_img'):
+            img = track.get(key)
+            if img is not None:
+                total += img.nbytes
+    return total
+
+class FrameSuperseded(Exception):
+    # A newer latest-only frame of the same camera took this frame's place in line
+    pass
+
+class Session:
+    def __init__(self, camera_id, state, generation=0):
+        self.camera_id = camera_id
+        self.state = state
+        # Distinguishes a recreated session of the same camera (its track ids start over)
+        self.generation = generation
+        self.key = (camera_id, generation)
+        # Frames of one camera are processed one at a time, in arrival order (asyncio.Lock is FIFO)
+        self.lock = asyncio.Lock()
+        self.pending = 0 # requests holding or waiting for the lock
+        self.waiting = None # ticket of the latest-only frame waiting for the lock, at most one
+        self.frame_idx = 0
+        self.sent_crops = {} # track_id -> best crop version already sent in a response
+        self.last_seen = time.monotonic()
+
+class SessionRegistry:
+    # Per-camera tracker state for the API server. The pipeline (YOLO + OCR) is shared,
+    # each camera id gets its own StreamState. Idle sessions are evicted, and when the
+    # kept plate images exceed max_memory_mb the least recently used sessions go first.
+    # Only touched from the event loop thread.
+    def __init__(self, pipeline, idle_timeout=300, max_sessions=64, max_memory_mb=512, max_history=200,
+                 sweep_interval=5.0, on_evict=None):
+        self.pipeline = pipeline
+        # Called with each evicted session (worker processes drop the tracker they hold for it)
+        self.on_evict = on_evict
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_bytes = max_memory_mb * 1024 * 1024
+        self.max_history = max_history # finished tracks kept per session
+        self.sweep_interval = sweep_interval
+
+        self.sessions = OrderedDict() # camera_id -> Session, least recently used first
+        self.last_sweep = time.monotonic()
+        self.generations = itertools.count(1)
+        self.evicted = 0
+        self.retired_motion = [0, 0] # motion gate (checked, skipped) of evicted sessions
+
+    def get(self, camera_id):
+        session = self.sessions.get(camera_id)
+        if session is None:
+            session = Session(camera_id, self.pipeline.new_stream_state(camera_id), next(self.generations))
+            self.sessions[camera_id] = session
+        self.sessions.move_to_end(camera_id)
+        session.last_seen = time.monotonic()
+        return session
+
+    @asynccontextmanager
+    async def session(self, camera_id, latest_only=False):
+        # latest_only: live frames, where only the newest one is worth processing. Such a
+        # frame waits for the camera alone; a newer latest-only frame replaces it and the
+        # older request gets FrameSuperseded. Other requests (batches) queue in order.
+        session = self.get(camera_id)
+        session.pending += 1
+        if len(self.sessions) > self.max_sessions or time.monotonic() - self.last_sweep >= self.sweep_interval:
+            self.sweep()
+        try:
+            if latest_only:
+                await self._acquire_latest(session)
+            else:
+                await session.lock.acquire()
+            try:
+                yield session
+            finally:
+                session.lock.release()
+        finally:
+            session.pending -= 1
+            session.last_seen = time.monotonic()
+
+    async def _acquire_latest(self, session):
+        if session.waiting is not None and not session.waiting.done():
+            session.waiting.set_result(None)
+        ticket = asyncio.get_running_loop().create_future()
+        session.waiting = ticket
+        acquire = asyncio.ensure_future(session.lock.acquire())
+
+        def abandon():
+            if acquire.done() and not acquire.cancelled():
+                session.lock.release()
+            else:
+                acquire.cancel()
+
+        try:
+            await asyncio.wait({acquire, ticket}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            abandon()
+            raise
+        finally:
+            if session.waiting is ticket:
+                session.waiting = None
+        if ticket.done():
+            abandon()
+            raise FrameSuperseded()
+
+    def _evict(self, camera_id):
+        session = self.sessions.pop(camera_id)
+        if self.on_evict:
+            self.on_evict(session)
+        gate = session.state.motion_gate
+        if gate is not None:
+            self.retired_motion[0] += gate.checked
+            self.retired_motion[1] += gate.skipped
+        self.evicted += 1
+
+    def sweep(self):
+        now = time.monotonic()
+        self.last_sweep = now
+
+        # Sessions with a frame in flight are never evicted, their next frame would reset the tracker
+        for camera_id, session in list(self.sessions.items()):
+            if session.pending == 0 and now - session.last_seen > self.idle_timeout:
+                self._evict(camera_id)
+
+        total = 0
+        for session in self.sessions.values():
+            if session.pending == 0:
+                tracker = session.state.tracker
+                tracker.prune_history(self.max_history)
+                session.sent_crops = {tid: v for tid, v in session.sent_crops.items() if tid in tracker.all_tracks}
+            total += session_bytes(session.state)
+
+        for camera_id, session in list(self.sessions.items()):
+            if len(self.sessions) <= self.max_sessions and total <= self.max_bytes:
+                break
+            if session.pending == 0:
+                total -= session_bytes(session.state)
+                self._evict(camera_id)
+
+    def motion_totals(self):
+        checked, skipped = self.retired_motion
+        for session in self.sessions.values():
+            gate = session.state.motion_gate
+            if gate is not None:
+                checked += gate.checked
+                skipped += gate.skipped
+        return checked, skipped
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "evicted": self.evicted,
+            "memory_mb": round(sum(session_bytes(s.state) for s in self.sessions.values()) / (1024 * 1024), 1),
+        }
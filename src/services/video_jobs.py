@@ -0,0 +1,165 @@
+# src/services/video_jobs.py
+import os
+import cv2
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class VideoJob:
+    def __init__(self, job_id, camera_id, path, state, max_results=10000):
+        self.job_id = job_id
+        self.camera_id = camera_id
+        self.path = path
+        self.state = state # own tracker, a job never shares state with a live camera session
+        self.status = "queued" # queued | running | done | failed | cancelled
+        self.error = None
+        self.total_frames = 0
+        # (frame_idx, time, tracks snapshot) per processed frame, in order. Only the last
+        # max_results are kept, results_base = index of results[0] among all frames processed
+        self.results = []
+        self.results_base = 0
+        self.max_results = max(1, int(max_results))
+        self.lock = threading.Lock()
+        self.seen = {} # track_id -> [first frame, last frame]
+        self.cancelled = threading.Event()
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def frames_done(self):
+        return self.results_base + len(self.results)
+
+    @property
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def progress(self):
+        if self.status == "done":
+            return 1.0
+        return min(1.0, self.frames_done / self.total_frames) if self.total_frames else 0.0
+
+    def fps(self):
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.frames_done / elapsed if elapsed > 0 else 0.0
+
+    def on_result(self, frame_idx, tracks):
+        # Called from the pipeline's writer thread
+        for t in tracks:
+            span = self.seen.setdefault(t['id'], [frame_idx, frame_idx])
+            span[1] = frame_idx
+        with self.lock:
+            self.results.append((frame_idx, time.time(), tracks))
+            # Trimmed in chunks, not one list shift per frame
+            excess = len(self.results) - self.max_results
+            if excess >= max(1, self.max_results // 10):
+                del self.results[:excess]
+                self.results_base += excess
+
+    def results_since(self, since, limit=None):
+        # (index of the first result returned, results) from result index since on. Results
+        # that already left the window are skipped, the first index tells how many
+        with self.lock:
+            start = max(since, self.results_base)
+            end = len(self.results) if limit is None else start - self.results_base + limit
+            return start, self.results[start - self.results_base:end]
+
+class VideoJobManager:
+    # Server-side video jobs: the upload is decoded and processed on the server through
+    # ALPRPipeline.process_video (decode / batched inference / encode threads), no per-frame
+    # HTTP round trip. Jobs run max_concurrent at a time in background threads, the model
+    # calls interleave with live cameras under the pipeline's model lock. Finished jobs are
+    # kept (results + tracker for the plate summary) until max_jobs is exceeded.
+    def __init__(self, pipeline, job_dir, max_jobs=16, max_concurrent=1, max_results=10000):
+        self.pipeline = pipeline
+        self.job_dir = job_dir
+        self.max_jobs = max_jobs
+        self.max_results = max_results
+        os.makedirs(job_dir, exist_ok=True)
+
+        self.jobs = OrderedDict() # job_id -> VideoJob, oldest first
+        self.lock = threading.Lock()
+        self.workers = ThreadPoolExecutor(max_workers=max(1, int(max_concurrent)), thread_name_prefix="video-job")
+
+    def new_upload_path(self, filename):
+        ext = os.path.splitext(filename or "")[1].lower() or ".mp4"
+        job_id = uuid.uuid4().hex[:12]
+        return job_id, os.path.join(self.job_dir, f"{job_id}{ext}")
+
+    def submit(self, job_id, path, camera_id="JOB"):
+        job = VideoJob(job_id, camera_id, path, self.pipeline.new_stream_state(camera_id), self.max_results)
+        with self.lock:
+            self.jobs[job_id] = job
+            self._trim()
+        self.workers.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancelled.set()
+        if job.is_finished:
+            with self.lock:
+                self.jobs.pop(job_id, None)
+        return job
+
+    def _trim(self):
+        # Oldest finished jobs go first, running or queued jobs are never dropped
+        for job_id, job in list(self.jobs.items()):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if job.is_finished:
+                del self.jobs[job_id]
+
+    def _run(self, job):
+        if job.cancelled.is_set():
+            job.status = "cancelled"
+            self._cleanup(job)
+            return
+
+        cap = cv2.VideoCapture(job.path)
+        opened = cap.isOpened()
+        job.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if opened else 0
+        cap.release()
+
+        job.status = "running"
+        job.started = time.time()
+        try:
+            if not opened:
+                raise ValueError("Không đọc được file video.")
+            self.pipeline.process_video(job.path, state=job.state, on_result=job.on_result,
+                                        should_stop=job.cancelled.is_set, verbose=False)
+            job.status = "cancelled" if job.cancelled.is_set() else "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+            self._cleanup(job)
+
+    def _cleanup(self, job):
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+
+    def stats(self):
+        jobs = list(self.jobs.values())
+        return {
+            "jobs": len(jobs),
+            "running": sum(1 for j in jobs if j.status == "running"),
+            "queued": sum(1 for j in jobs if j.status == "queued"),
+        }
+
+    def stop(self):
+        for job in list(self.jobs.values()):
+            job.cancelled.set()
+        self.workers.shutdown(wait=False)
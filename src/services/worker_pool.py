@@ -0,0 +1,461 @@
+# src/services/worker_pool.py
+import time
+import queue
+import zlib
+import asyncio
+import itertools
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import numpy as np
+
+def camera_worker(camera_id, num_workers):
+    # Stable across processes and restarts (unlike hash()), a camera always lands on the same worker
+    return zlib.crc32(str(camera_id).encode('utf-8')) % num_workers
+
+class TrackMirror:
+    # What the API process knows about a camera's tracks living in a worker: best text,
+    # best crop version and image, enough for FrameResult, crop refs and GET /crops
+    def __init__(self):
+        self.all_tracks = OrderedDict() # track_id -> {'best_text', 'best_conf', 'best_crop', 'best_img'}
+        self.tracks = {} # ids of the tracks alive in the worker's latest frame
+
+    def apply(self, tracks, crops):
+        for trk in tracks:
+            entry = self.all_tracks.setdefault(trk['id'], {'best_crop': None, 'best_img': None})
+            entry['best_text'] = trk['best_text']
+            entry['best_conf'] = trk['best_conf']
+            crop = crops.get(trk['id'])
+            if crop is not None:
+                entry['best_crop'] = crop
+                entry['best_img'] = crop[1]
+        self.tracks = {trk['id']: trk for trk in tracks}
+
+    def prune_history(self, keep=200):
+        finished = [tid for tid in self.all_tracks if tid not in self.tracks]
+        for tid in finished[:max(0, len(finished) - keep)]:
+            del self.all_tracks[tid]
+
+class GateMirror:
+    # Counters of the camera's motion gate in the worker, for the API's skip rate
+    def __init__(self):
+        self.checked = 0
+        self.skipped = 0
+
+class RemoteStreamState:
+    # Stands in for StreamState in the API process, the real one lives in the camera's worker
+    def __init__(self, camera_id, uid):
+        self.camera_id = camera_id
+        self.uid = uid # a recreated session gets a new uid, the worker then starts a fresh tracker
+        self.tracker = TrackMirror()
+        self.motion_gate = None # GateMirror once the worker reports a gate
+
+def _track_payload(state, tracks, sent_versions, crops):
+    out = []
+    for trk in tracks:
+        track = state.tracker.all_tracks.get(trk['id'], trk)
+        crop = track.get('best_crop')
+        if crop is not None and sent_versions.get(trk['id']) != crop[0]:
+            crops[trk['id']] = crop
+            sent_versions[trk['id']] = crop[0]
+        # Best read as of this frame, the batch's later frames may have moved the track on
+        best_text, best_conf, best_version = trk.get('frame_best') or (
+            track.get('best_text', ''), track.get('best_conf', 0.0), crop[0] if crop else 0)
+        item = {
+            'id': trk['id'], 'box': [int(v) for v in trk['box']], 'conf': float(trk.get('conf', 0.0)),
+            'text': trk.get('text', ''), 'ocr_conf': float(trk.get('ocr_conf', 0.0)),
+            'predicted': bool(trk.get('predicted', False)),
+            'best_text': best_text, 'best_conf': float(best_conf),
+            'frame_best': (best_text, float(best_conf), int(best_version)),
+        }
+        # The frame's plate crop, for the tracks the API's detection log writes (same condition)
+        if trk.get('plate_img') is not None and (item['text'] or item['ocr_conf'] > 0):
+            item['plate_img'] = trk['plate_img']
+        out.append(item)
+    return out
+
+def worker_main(worker_id, model_path, settings, shm_name, slot_bytes, requests, results, max_batch, max_wait_ms,
+                max_history, warmup):
+    # One inference process: its own models, the trackers of the cameras routed to it
+    try:
+        from src.pipeline import ALPRPipeline
+
+        pipeline = ALPRPipeline.from_settings(model_path, settings, use_gpu=True)
+        if warmup:
+            width, height = settings['api']['warmup']['frame_size']
+            pipeline.warmup(frame_shape=(height, width, 3), batch_sizes={1, max_batch})
+    except Exception as e:
+        results.put(('failed', worker_id, str(e)))
+        return
+    results.put(('ready', worker_id, pipeline.load_times))
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    streams = {} # camera_id -> [uid, StreamState, sent crop versions]
+    batches = 0
+    metrics_seen = {} # what of the worker's stage metrics the API already has
+
+    def release(camera_id, uid):
+        # The API evicted the session, its tracker goes too
+        if camera_id in streams and streams[camera_id][0] == uid:
+            del streams[camera_id]
+
+    try:
+        while True:
+            req = requests.get()
+            if req is None:
+                break
+            if req[0] is None:
+                release(req[1], req[2])
+                continue
+            batch, frames_in_batch = [req], len(req[3])
+            deadline = time.monotonic() + max_wait_ms / 1000.0
+            # Whatever else is queued joins the batch: one detector pass for all of them
+            while frames_in_batch < max_batch:
+                try:
+                    nxt = requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    requests.put(None)
+                    break
+                if nxt[0] is None:
+                    if any(r[1] == nxt[1] for r in batch):
+                        # Released after frames of the same batch were sent, keep the order
+                        requests.put(nxt)
+                        break
+                    release(nxt[1], nxt[2])
+                    continue
+                batch.append(nxt)
+                frames_in_batch += len(nxt[3])
+
+            frames, states, indices = [], [], []
+            for req_id, camera_id, uid, items in batch:
+                stream = streams.get(camera_id)
+                if stream is None or stream[0] != uid:
+                    stream = streams[camera_id] = [uid, pipeline.new_stream_state(camera_id), {}]
+                for slot, frame, frame_idx in items:
+                    if slot is not None:
+                        # Copied out of the slot: crops kept by the tracker may be views of the frame
+                        shape = frame
+                        view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                        frame = view.copy()
+                    frames.append(frame)
+                    states.append(stream[1])
+                    indices.append(frame_idx)
+
+            try:
+                batch_tracks = pipeline.process_frames_batch(frames, states, indices)
+            except Exception as e:
+                for req_id, _, _, _ in batch:
+                    results.put(('error', req_id, str(e)))
+                continue
+            finally:
+                # Stage timings and frame counters are merged into the API's /metrics
+                changes = pipeline.metrics.changes(metrics_seen)
+                if changes:
+                    results.put(('metrics', worker_id, changes))
+
+            start = 0
+            for req_id, camera_id, uid, items in batch:
+                stream = streams[camera_id]
+                crops = {}
+                per_frame = [_track_payload(stream[1], tracks, stream[2], crops)
+                             for tracks in batch_tracks[start:start + len(items)]]
+                start += len(items)
+                gate = stream[1].motion_gate
+                gate_counts = (gate.checked, gate.skipped) if gate is not None else None
+                results.put(('result', req_id, (per_frame, crops, gate_counts)))
+
+            batches += 1
+            if batches % 100 == 0:
+                for stream in streams.values():
+                    stream[1].tracker.prune_history(max_history)
+                    stream[2] = {tid: v for tid, v in stream[2].items() if tid in stream[1].tracker.all_tracks}
+    finally:
+        shm.close()
+
+class WorkerPool:
+    # N inference processes, each with its own YOLO + OCR, for the GIL-bound Python parts
+    # (post-processing, preprocessing, tracking). A camera is pinned to one worker by
+    # crc32(camera_id), so its tracker never moves. Frames go through per-worker shared
+    # memory slots, only a small header is pickled; a request waits for free slots, only a
+    # frame larger than a slot is sent inline. Same submit / submit_batch / stats interface as
+    # InferenceExecutor, and new_stream_state for SessionRegistry. The workers' stage timings
+    # and frame counters are merged into `metrics` (the API's registry) after every batch.
+    def __init__(self, model_path, settings, count=2, slot_mb=8, slots_per_worker=16, max_batch=8, max_wait_ms=5,
+                 request_timeout_s=30, start_timeout=600, metrics=None):
+        self.model_path = model_path
+        self.settings = settings
+        self.count = max(1, int(count))
+        self.slot_bytes = int(slot_mb * 1024 * 1024)
+        self.slots_per_worker = max(1, int(slots_per_worker))
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.request_timeout_s = request_timeout_s
+        self.start_timeout = start_timeout
+        self.metrics = metrics
+
+        self.ctx = mp.get_context('spawn') # CUDA / Paddle do not survive fork
+        self.results = self.ctx.Queue()
+        self.requests = []
+        self.processes = []
+        self.shms = []
+        self.free_slots = [] # per worker, only touched from the event loop
+
+        self.uids = itertools.count(1)
+        self.req_ids = itertools.count(1)
+        self.pending = {} # req_id -> (future, worker, slots, state)
+        self.loop = None
+        self.reader = None
+        self.stopped = False
+
+        self.load_times = {}
+        self.failed = None
+        self.dead = set() # workers whose process exited, their cameras get errors from then on
+        self.batches = 0
+        self.frames = 0
+        self.inline_frames = 0
+
+    def launch(self):
+        # Blocking: spawns the workers and waits until every one has loaded and warmed up its models
+        # Whatever goes wrong (a worker failing or dying, the timeout), processes and
+        # shared memory are released before the error propagates
+        try:
+            self._spawn_workers()
+            self._wait_ready()
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def _spawn_workers(self):
+        max_history = self.settings['api']['sessions']['max_history']
+        warmup = self.settings['api']['warmup']['enabled']
+        for worker_id in range(self.count):
+            shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.slots_per_worker)
+            self.shms.append(shm)
+            requests = self.ctx.Queue()
+            self.requests.append(requests)
+            process = self.ctx.Process(
+                target=worker_main, name=f"alpr-worker-{worker_id}", daemon=True,
+                args=(worker_id, self.model_path, self.settings, shm.name, self.slot_bytes, requests, self.results,
+                      self.max_batch, self.max_wait_ms, max_history, warmup))
+            process.start()
+            self.processes.append(process)
+            self.free_slots.append(list(range(self.slots_per_worker)))
+
+    def _wait_ready(self):
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.start_timeout
+        waiting = set(range(self.count))
+        while waiting:
+            try:
+                kind, worker_id, payload = self.results.get(timeout=1.0)
+            except queue.Empty:
+                # A worker killed while loading (OOM, segfault in a native library) never reports
+                dead = [self.processes[w].name for w in waiting if not self.processes[w].is_alive()]
+                if dead:
+                    raise RuntimeError(f"worker process exited while loading: {', '.join(dead)}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"workers not ready after {self.start_timeout}s")
+                continue
+            if kind == 'failed':
+                raise RuntimeError(f"worker {worker_id}: {payload}")
+            self.load_times[f"worker_{worker_id}"] = payload
+            waiting.discard(worker_id)
+        self.load_times['total'] = round(time.perf_counter() - start, 3)
+
+    def start(self):
+        # Binds the pool to the server's event loop, results are resolved there
+        if self.reader is None:
+            self.loop = asyncio.get_running_loop()
+            self.slot_locks = [asyncio.Lock() for _ in range(self.count)]
+            self.slot_sems = [asyncio.Semaphore(len(free)) for free in self.free_slots]
+            self.reader = threading.Thread(target=self._read_results, name="worker-results", daemon=True)
+            self.reader.start()
+        return self
+
+    def new_stream_state(self, camera_id="default"):
+        return RemoteStreamState(camera_id, next(self.uids))
+
+    def release(self, session):
+        # SessionRegistry eviction hook: the worker drops the camera's tracker
+        state = session.state
+        self.requests[camera_worker(state.camera_id, self.count)].put((None, state.camera_id, state.uid, None))
+
+    async def submit(self, state, frame, frame_idx=None):
+        results = await self.submit_batch(state, [frame], [frame_idx])
+        return results[0]
+
+    async def submit_batch(self, state, frames, frame_indices=None):
+        self.start()
+        if frame_indices is None:
+            frame_indices = [None] * len(frames)
+
+        worker = camera_worker(state.camera_id, self.count)
+        if worker in self.dead:
+            raise RuntimeError(f"worker process exited: {self.processes[worker].name}")
+
+        # More frames than the worker has slots go in slot-sized chunks, each waiting for
+        # free slots, rather than being pickled through the queue. Chunks are sent in order
+        futures = []
+        for start in range(0, len(frames), self.slots_per_worker):
+            chunk = [(np.ascontiguousarray(frame, dtype=np.uint8), frame_idx) for frame, frame_idx in
+                     zip(frames[start:start + self.slots_per_worker], frame_indices[start:start + self.slots_per_worker])]
+            fits = sum(1 for frame, _ in chunk if frame.nbytes <= self.slot_bytes)
+            slots = await self._bounded(worker, self._take_slots(worker, fits))
+            futures.append(self._send(worker, state, chunk, slots))
+
+        results = []
+        for future in futures:
+            results.extend(await self._bounded(worker, future))
+        return results
+
+    async def _bounded(self, worker, awaitable):
+        # A hung worker must not hold the session lock and admission slot forever. A request
+        # that timed out stays pending, a late answer still frees its slots and updates the mirror
+        try:
+            return await asyncio.wait_for(awaitable, self.request_timeout_s)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"worker {worker} did not answer within {self.request_timeout_s}s") from None
+
+    async def _take_slots(self, worker, n):
+        # All n slots at once, in arrival order: two requests each holding part of
+        # what they need would otherwise wait on each other forever
+        sem, taken = self.slot_sems[worker], 0
+        try:
+            async with self.slot_locks[worker]:
+                while taken < n:
+                    await sem.acquire()
+                    taken += 1
+        except BaseException:
+            for _ in range(taken):
+                sem.release()
+            raise
+        free = self.free_slots[worker]
+        slots = [free.pop() for _ in range(n)]
+        if worker in self.dead:
+            self._release_slots(worker, slots)
+            raise RuntimeError(f"worker process exited: {self.processes[worker].name}")
+        return slots
+
+    def _release_slots(self, worker, slots):
+        self.free_slots[worker].extend(slots)
+        for _ in slots:
+            self.slot_sems[worker].release()
+
+    def _send(self, worker, state, chunk, slots):
+        shm, free_slots = self.shms[worker], iter(slots)
+        items = []
+        for frame, frame_idx in chunk:
+            if frame.nbytes <= self.slot_bytes:
+                slot = next(free_slots)
+                np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf, offset=slot * self.slot_bytes)[...] = frame
+                items.append((slot, frame.shape, frame_idx))
+            else:
+                # Larger than a slot (raise slot_mb for such cameras)
+                self.inline_frames += 1
+                items.append((None, frame, frame_idx))
+
+        req_id = next(self.req_ids)
+        future = self.loop.create_future()
+        self.pending[req_id] = (future, worker, slots, state)
+        self.requests[worker].put((req_id, state.camera_id, state.uid, items))
+        return future
+
+    def _read_results(self):
+        # Liveness is checked on a timer, not only when the queue goes quiet: the other
+        # workers keep results coming while one of them is dead
+        reported = set()
+        next_check = 0.0
+        while not self.stopped:
+            try:
+                kind, req_id, payload = self.results.get(timeout=0.5)
+                if kind == 'metrics':
+                    # Registry updates are thread-safe, no need to go through the loop
+                    if self.metrics is not None:
+                        self.metrics.merge(payload)
+                else:
+                    self.loop.call_soon_threadsafe(self._resolve, kind, req_id, payload)
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                break
+
+            now = time.monotonic()
+            if now >= next_check and not self.stopped:
+                next_check = now + 0.5
+                for worker, process in enumerate(self.processes):
+                    if worker not in reported and not process.is_alive():
+                        reported.add(worker)
+                        self.loop.call_soon_threadsafe(self._fail_worker, worker,
+                                                       f"worker process exited: {process.name}")
+
+    def _resolve(self, kind, req_id, payload):
+        entry = self.pending.pop(req_id, None)
+        if entry is None:
+            return
+        future, worker, slots, state = entry
+        # Slots come back once the worker answered, never while it may still read them
+        self._release_slots(worker, slots)
+        if kind == 'error':
+            if not future.done():
+                future.set_exception(RuntimeError(payload))
+            return
+
+        # Mirrored even when the caller went away: the worker's tracker has moved on and
+        # counts these crops as sent
+        per_frame, crops, gate_counts = payload
+        for tracks in per_frame:
+            state.tracker.apply(tracks, crops)
+        if gate_counts is not None:
+            if state.motion_gate is None:
+                state.motion_gate = GateMirror()
+            state.motion_gate.checked, state.motion_gate.skipped = gate_counts
+        self.batches += 1
+        self.frames += len(per_frame)
+        if not future.done():
+            future.set_result(per_frame)
+
+    def _fail_worker(self, worker, reason):
+        # Only the requests routed to the dead worker fail, the other workers keep serving
+        self.dead.add(worker)
+        self.failed = reason
+        for req_id, entry in list(self.pending.items()):
+            if entry[1] != worker:
+                continue
+            del self.pending[req_id]
+            # Wakes requests waiting for this worker's slots, they see it dead and fail too
+            self._release_slots(worker, entry[2])
+            if not entry[0].done():
+                entry[0].set_exception(RuntimeError(reason))
+
+    def healthy(self):
+        return not self.dead and all(p.is_alive() for p in self.processes)
+
+    def queued(self):
+        return len(self.pending)
+
+    def stats(self):
+        return {
+            "workers": self.count,
+            "alive": sum(1 for p in self.processes if p.is_alive()),
+            "requests": self.batches,
+            "frames": self.frames,
+            "inline_frames": self.inline_frames,
+            "queued": self.queued(),
+        }
+
+    def stop(self):
+        self.stopped = True
+        for requests in self.requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+        self.shms = []
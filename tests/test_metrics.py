@@ -0,0 +1,50 @@
+# tests/test_metrics.py
+# Worker processes ship their registry's changes() to the API, which merge()s them into /metrics
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'src'))
+
+from services.metrics import MetricsRegistry
+
+def make_worker_registry():
+    worker = MetricsRegistry()
+    timer = worker.histogram('alpr_stage_seconds', 'Time per pipeline / API stage', stage='detect')
+    frames = worker.counter('alpr_frames_total', 'Frames processed by the pipeline', path='detect')
+    worker.gauge('alpr_sessions', 'Camera sessions held by the API', fn=lambda: 3)
+    return worker, timer, frames
+
+def test_changes_are_deltas_since_last_call():
+    worker, timer, frames = make_worker_registry()
+    seen = {}
+    timer.observe(0.02)
+    frames.inc(2)
+    assert len(worker.changes(seen)) == 2
+    # Nothing moved: nothing to send, gauges are never sent
+    assert worker.changes(seen) == []
+
+    frames.inc()
+    changes = worker.changes(seen)
+    assert [(kind, name, delta) for kind, name, _, _, delta in changes] == [('counter', 'alpr_frames_total', 1)]
+
+def test_merge_adds_worker_values_to_api_registry():
+    api = MetricsRegistry()
+    api_timer = api.histogram('alpr_stage_seconds', 'Time per pipeline / API stage', stage='detect')
+    api_timer.observe(0.003)
+
+    worker, timer, frames = make_worker_registry()
+    seen = {}
+    for _ in range(2):
+        # Two batches of one worker, each merged as it arrives
+        for value in (0.02, 0.2):
+            timer.observe(value)
+        frames.inc(2)
+        api.merge(worker.changes(seen))
+
+    assert api_timer.count == 5
+    assert api_timer.sum == pytest.approx(0.003 + 2 * 0.22)
+    assert api.counter('alpr_frames_total', 'Frames processed by the pipeline', path='detect').get() == 4
+    assert 'alpr_sessions' not in api.families
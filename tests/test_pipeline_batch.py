@@ -0,0 +1,73 @@
+# tests/test_pipeline_batch.py
+# Several frames of one camera in one process_frames_batch call: every frame keeps its own result
+import os
+import sys
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'src'))
+
+import pipeline
+
+# One plate moving right by 10 px a frame, the frame's first pixel says which frame it is
+BOXES = [[390, 200, 470, 230], [400, 200, 480, 230], [410, 200, 490, 230], [420, 200, 500, 230]]
+# OCR reads get better with every call, so the track's best read changes within the batch
+CONFS = [0.6, 0.7, 0.8, 0.9]
+
+class FakeDetector:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def detect_batch(self, images, regions=None, windows=None):
+        return [[{'box': list(BOXES[int(image[0, 0, 0])]), 'conf': 0.9}] for image in images]
+
+class FakeOCR:
+    def __init__(self, *args, **kwargs):
+        self.calls = 0
+
+    def predict_batch(self, images):
+        conf = CONFS[self.calls]
+        self.calls += 1
+        return [("29A12345", conf)] * len(images)
+
+@pytest.fixture
+def alpr(monkeypatch, tmp_path):
+    weights = tmp_path / "best.pt"
+    weights.write_bytes(b"")
+    monkeypatch.setattr(pipeline, 'PlateDetector', FakeDetector)
+    monkeypatch.setattr(pipeline, 'LicensePlateOCR', FakeOCR)
+    return pipeline.ALPRPipeline(str(weights), use_gpu=False, parallel_load=False)
+
+def make_frames(n):
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(n):
+        frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+        frame[0, 0] = i
+        frames.append(frame)
+    return frames
+
+def test_batch_frames_keep_their_own_boxes(alpr):
+    state = alpr.new_stream_state('CAM_A')
+    results = alpr.process_frames_batch(make_frames(4), [state] * 4, frame_indices=[0, 1, 2, 3])
+
+    assert [len(tracks) for tracks in results] == [1, 1, 1, 1]
+    # The track is born on frame 0: that frame must still report its own box, not the last one
+    assert [tracks[0]['box'] for tracks in results] == BOXES
+    assert len({tracks[0]['id'] for tracks in results}) == 1
+    assert state.tracker.tracks[results[0][0]['id']]['box'] == BOXES[-1]
+
+def test_batch_frames_keep_their_own_best_read(alpr):
+    state = alpr.new_stream_state('CAM_A')
+    results = alpr.process_frames_batch(make_frames(4), [state] * 4, frame_indices=[0, 1, 2, 3])
+
+    # The OCR scheduler picks which frames are read, the first frame is always one of them
+    frame_best = [tracks[0]['frame_best'] for tracks in results]
+    assert frame_best[0] == ("29A12345", pytest.approx(CONFS[0]), 1)
+    assert [version for _, _, version in frame_best] == sorted(version for _, _, version in frame_best)
+
+    track = state.tracker.all_tracks[results[0][0]['id']]
+    assert track['best_crop'][0] == frame_best[-1][2] > 1
+    assert track['best_conf'] == pytest.approx(frame_best[-1][1])
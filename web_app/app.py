@@ -7,9 +7,11 @@ import tempfile
 import numpy as np
 import requests
 import base64
+import uuid
 from difflib import SequenceMatcher
 
 API_URL = os.getenv("API_URL", "http://localhost:8000/process_frame")
+API_BASE = os.getenv("API_BASE", API_URL.rsplit('/', 1)[0])
 SKIP_INTERVAL = 3 
 
 from rtsp_stream import RTSPVideoStream
@@ -45,9 +47,16 @@ st.title("Hệ thống nhận diện biển số xe")
 
 if 'detected_plates' not in st.session_state:
     st.session_state['detected_plates'] = {} 
+if 'camera_id' not in st.session_state:
+    # Server keeps one tracker per camera_id, each browser session is its own camera
+    st.session_state['camera_id'] = f"WEB_{uuid.uuid4().hex[:8]}"
+if 'crops' not in st.session_state:
+    st.session_state['crops'] = {} # crop etag -> image
 
 def reset_session():
     st.session_state['detected_plates'] = {}
+    st.session_state['camera_id'] = f"WEB_{uuid.uuid4().hex[:8]}"
+    st.session_state['crops'] = {}
 
 def base64_to_numpy(base64_string):
     if not base64_string: 
@@ -56,6 +65,43 @@ def base64_to_numpy(base64_string):
     np_arr = np.frombuffer(img_bytes, np.uint8)
     return cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
 
+def resolve_crops(tracks):
+    # The API sends each best crop once (base64), later frames only carry its etag.
+    # Unknown etags (e.g. after a dropped response) are fetched from GET /crops/...
+    crops = st.session_state['crops']
+    for trk in tracks:
+        ref = trk.get('crop')
+        if not ref:
+            continue
+        if trk.get('crop_b64'):
+            crops[ref['etag']] = base64_to_numpy(trk['crop_b64'])
+        elif ref['etag'] not in crops:
+            try:
+                response = requests.get(API_BASE + ref['url'], timeout=5)
+                if response.status_code == 200:
+                    crops[ref['etag']] = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+            except Exception:
+                pass
+        trk['best_img'] = crops.get(ref['etag'])
+
+    while len(crops) > 500:
+        crops.pop(next(iter(crops)))
+
+def object_to_track(obj):
+    # FrameResult.objects (src/schemas.py) -> the track dicts used by the drawing / gallery code
+    ocr = obj.get('ocr') or {}
+    best = obj.get('best') or {}
+    return {
+        'id': obj['track_id'],
+        'box': obj['box'],
+        'text': ocr.get('text', ''),
+        'ocr_conf': ocr.get('conf', 0.0),
+        'best_text': best.get('text', ''),
+        'best_conf': best.get('conf', 0.0),
+        'crop': obj.get('crop'),
+        'crop_b64': obj.get('crop_b64'),
+    }
+
 def draw_tracks_on_frame(frame, tracks):
     img_draw = frame.copy()
     for trk in tracks:
@@ -80,31 +126,46 @@ def draw_tracks_on_frame(frame, tracks):
     return img_draw
 
 def call_process_api(frame, frame_idx):
+    # None = no new result (server busy or a newer frame took this one's place), keep the last tracks
+    if time.time() < st.session_state.get('retry_at', 0):
+        return None
     try:
         _, img_encoded = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
         
         files = {'file': ('frame.jpg', img_encoded.tobytes(), 'image/jpeg')}
-        params = {'frame_idx': frame_idx}
+        params = {'frame_idx': frame_idx, 'camera_id': st.session_state['camera_id']}
         
         response = requests.post(API_URL, files=files, params=params, timeout=5)
         
         if response.status_code == 200:
             result = response.json()
-            tracks = result.get('tracks', [])
-
-            for trk in tracks:
-                if trk.get('plate_img'):
-                    trk['plate_img'] = base64_to_numpy(trk['plate_img'])
-                if trk.get('best_img'):
-                    trk['best_img'] = base64_to_numpy(trk['best_img'])
-            
+            tracks = [object_to_track(obj) for obj in result.get('objects', [])]
+            resolve_crops(tracks)
             return tracks
+        elif response.status_code == 429:
+            st.session_state['retry_at'] = time.time() + float(response.headers.get('Retry-After', 1))
+            return None
+        elif response.status_code == 409:
+            return None
         else:
             return []
             
     except Exception as e:
         return []
 
+def start_video_job(path, filename):
+    # The whole file goes up once, the server decodes and processes it (POST /jobs)
+    with open(path, 'rb') as f:
+        response = requests.post(API_BASE + "/jobs", files={'file': (filename, f, 'application/octet-stream')},
+                                 params={'camera_id': st.session_state['camera_id']}, timeout=300)
+    response.raise_for_status()
+    return response.json()['job_id']
+
+def fetch_job_results(job_id, since):
+    response = requests.get(f"{API_BASE}/jobs/{job_id}/results", params={'since': since}, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
@@ -186,41 +247,77 @@ if run_system:
             frame = cv2.imdecode(file_bytes, 1)
             
             tracks = call_process_api(frame, 0)
-            processed_frame = draw_tracks_on_frame(frame, tracks)
-            update_gallery(tracks)
-            
-            st_frame.image(cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB), use_container_width=True)
-            render_gallery_ui(st_gallery)
-            st_status.success("Done")
+            if tracks is None:
+                # 429 / 409 or still inside the Retry-After window: show the image without results
+                st_frame.image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), use_container_width=True)
+                st_status.warning("Server đang bận, vui lòng thử lại sau giây lát.")
+            else:
+                processed_frame = draw_tracks_on_frame(frame, tracks)
+                update_gallery(tracks)
+
+                st_frame.image(cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB), use_container_width=True)
+                render_gallery_ui(st_gallery)
+                st_status.success("Done")
 
         elif file_type in ['mp4', 'avi', 'mov']:
-            tfile = tempfile.NamedTemporaryFile(delete=False) 
+            tfile = tempfile.NamedTemporaryFile(delete=False, suffix='.' + file_type)
             tfile.write(uploaded_file.read())
+            tfile.close()
             cap = cv2.VideoCapture(tfile.name)
-            st_status.info(f"Đang xử lý Video (Tốc độ x{SKIP_INTERVAL})...")
-            
+            st_status.info("Đang tải video lên server...")
+
+            try:
+                job_id = start_video_job(tfile.name, uploaded_file.name)
+            except Exception as e:
+                job_id = None
+                st_status.error(f"Không tạo được job: {e}")
+
+            # Every frame is processed on the server, results are pulled in chunks and drawn
+            # on the local copy as playback reaches them
+            results = {} # frame_id -> tracks
+            next_idx = 0
+            status = 'queued'
             frame_idx = 0
-            last_tracks = [] 
-            
-            while cap.isOpened():
+
+            while job_id and cap.isOpened():
                 ret, frame = cap.read()
                 if not ret: break
-                if frame_idx % SKIP_INTERVAL == 0:
-                    new_tracks = call_process_api(frame, frame_idx)
-                    if new_tracks is not None:
-                        last_tracks = new_tracks
-                        update_gallery(last_tracks)
-                processed_frame = draw_tracks_on_frame(frame, last_tracks)
-                
+
+                while frame_idx not in results and status not in ('done', 'failed', 'cancelled'):
+                    try:
+                        data = fetch_job_results(job_id, next_idx)
+                    except Exception:
+                        time.sleep(0.5)
+                        continue
+                    for res in data['results']:
+                        results[res['frame_id']] = [object_to_track(obj) for obj in res.get('objects', [])]
+                    next_idx = data['next']
+                    if not data['results']:
+                        status = data['status']
+                        if status not in ('done', 'failed', 'cancelled'):
+                            st_status.info(f"Server đang xử lý video... ({next_idx} frame)")
+                            time.sleep(0.2)
+
+                tracks = results.pop(frame_idx, [])
+                if tracks:
+                    resolve_crops(tracks)
+                    update_gallery(tracks)
+                processed_frame = draw_tracks_on_frame(frame, tracks)
+
                 st_frame.image(cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB), use_container_width=True)
-                
+
                 if frame_idx % 10 == 0: 
                     render_gallery_ui(st_gallery)
-                
+
                 frame_idx += 1
-            
+
             cap.release()
-            st_status.success("Hoàn tất")
+            os.remove(tfile.name)
+            render_gallery_ui(st_gallery)
+            if status == 'failed':
+                st_status.error("Server xử lý video lỗi.")
+            elif job_id:
+                st_status.success("Hoàn tất")
 
     elif source_option in ["RTSP Camera", "Webcam Laptop"]:
         st_status.info("Đang kết nối...")
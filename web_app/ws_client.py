@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import struct
+import argparse
+import threading
+import cv2
+from websockets.sync.client import connect
+
+WS_URL = os.getenv("WS_URL", "ws://localhost:8000/ws")
+FRAME_HEADER = struct.Struct('>Q')
+
+class StreamClient:
+    # Streams frames of one camera to /ws/{camera_id} and keeps the newest result.
+    # send() never waits for inference: the server drops frames it can't keep up with
+    def __init__(self, camera_id, base_url=WS_URL, jpeg_quality=80):
+        self.url = f"{base_url.rstrip('/')}/{camera_id}"
+        self.jpeg_quality = jpeg_quality
+        self.conn = None
+        self.frame_id = 0
+        self.lock = threading.Lock()
+        self.result = None
+        self.stopped = False
+
+    def start(self):
+        self.conn = connect(self.url, max_size=None)
+        t = threading.Thread(target=self.update, args=())
+        t.daemon = True
+        t.start()
+        return self
+
+    def update(self):
+        try:
+            for message in self.conn:
+                result = json.loads(message)
+                with self.lock:
+                    self.result = result
+        except Exception:
+            pass
+        finally:
+            self.stopped = True
+
+    def send(self, frame):
+        _, img_encoded = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        self.frame_id += 1
+        self.conn.send(FRAME_HEADER.pack(self.frame_id) + img_encoded.tobytes())
+        return self.frame_id
+
+    def latest(self):
+        with self.lock:
+            return self.result
+
+    def stop(self):
+        self.stopped = True
+        if self.conn:
+            self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='video file / RTSP url / webcam index')
+    parser.add_argument('--camera', default='CAM_01')
+    parser.add_argument('--fps', type=float, default=25.0)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+    client = StreamClient(args.camera).start()
+    last_printed = None
+    try:
+        while not client.stopped:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            client.send(frame)
+
+            result = client.latest()
+            if result and result['frame_id'] != last_printed:
+                last_printed = result['frame_id']
+                texts = [obj['best']['text'] for obj in result.get('objects', []) if obj.get('best', {}).get('text')]
+                print(f"frame {result['frame_id']} | {result.get('processing_time_ms')} ms"
+                      f" | dropped {result.get('dropped')} | {texts}")
+            time.sleep(1.0 / args.fps)
+    finally:
+        cap.release()
+        client.stop()